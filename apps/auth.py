@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Annotated, Optional, Tuple
+
+import jwt
+from fastapi import Depends, HTTPException, Request, status
+
+from apps.config import SECRET_KEY, ALGORITHM, TOKEN_CACHE_MAX_SIZE
+from apps.models import oauth2_scheme
+from apps.schemas import TokenIntrospectionSchema
+
+
+class TokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[str, Tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, token: str) -> Optional[dict]:
+        item = self._items.get(token)
+        if item is None:
+            return None
+        exp, payload = item
+        if exp <= time.time():
+            del self._items[token]
+            return None
+        self._items.move_to_end(token)
+        return payload
+
+    def set(self, token: str, payload: dict) -> None:
+        exp = payload.get('exp')
+        if exp is None:
+            return
+        self._items[token] = (exp, payload)
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+token_cache = TokenCache(max_size=TOKEN_CACHE_MAX_SIZE)
+
+
+def decode_access_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={'require': ['exp']})
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate credentials',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    token_cache.set(token, payload)
+    return payload
+
+
+def introspect_token(token: str) -> TokenIntrospectionSchema:
+    try:
+        payload = decode_access_token(token)
+    except HTTPException:
+        return TokenIntrospectionSchema(active=False)
+    return TokenIntrospectionSchema(active=True, sub=payload.get('sub'), user_id=payload.get('user_id'),
+                                    exp=payload.get('exp'))
+
+
+async def get_access_token(request: Request, bearer_token: Annotated[Optional[str], Depends(oauth2_scheme)]) -> str:
+    token = bearer_token or request.cookies.get('access_token')
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Not authenticated',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    return token
+
+
+# Async (like get_access_token) so FastAPI runs it on the event loop: the token cache is not thread-safe.
+async def get_current_token_payload(token: Annotated[str, Depends(get_access_token)]) -> dict:
+    return decode_access_token(token)
@@ -0,0 +1,123 @@
+import abc
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from apps.config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS
+
+MISSING = object()
+
+
+class CacheBackend(abc.ABC):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @abc.abstractmethod
+    async def get(self, key: Hashable) -> Any:
+        """Return the cached value or ``MISSING``."""
+
+    @abc.abstractmethod
+    async def set(self, key: Hashable, value: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: Hashable) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def get(self, key: Hashable) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return MISSING
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key: Hashable, value: Any) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: Hashable) -> None:
+        self._items.pop(key, None)
+
+    async def clear(self) -> None:
+        self._items.clear()
+
+
+class ReadThroughCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            value = await self.backend.get(key)
+            if value is not MISSING:
+                return value
+
+            future = self._inflight.get(key)
+            if future is None:
+                return await self._load(key, loader)
+            # Unlike awaiting the future, wait() does not raise if the load was cancelled.
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+            # The leader was cancelled (client gone, timeout), not us: load again.
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Waiters re-raise it; make sure an unobserved error is not logged.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # A write that invalidated the key while we were loading wins.
+            if self._inflight.get(key) is future:
+                await self.backend.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def invalidate(self, key: Hashable) -> None:
+        self._inflight.pop(key, None)
+        await self.backend.delete(key)
+
+    async def clear(self) -> None:
+        self._inflight.clear()
+        await self.backend.clear()
+
+
+user_cache = ReadThroughCache(InMemoryCacheBackend(max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS))
@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class BatchCoalescer:
+    """Merge concurrent single-key loads into batched ``load_many`` calls.
+
+    Keys requested within the same event loop iteration (or within
+    ``max_delay`` seconds, if set) are resolved together, in batches of at
+    most ``max_batch_size``. Keys that ``load_many`` does not return resolve
+    to ``None``.
+    """
+
+    def __init__(self, load_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 max_batch_size: int, max_delay: float = 0):
+        self.load_many = load_many
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._scheduled: Optional[asyncio.Handle] = None
+        self._dispatching: set = set()
+
+    async def load(self, key: Hashable) -> Any:
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self.flush()
+            elif self._scheduled is None:
+                loop = asyncio.get_running_loop()
+                if self.max_delay:
+                    self._scheduled = loop.call_later(self.max_delay, self.flush)
+                else:
+                    self._scheduled = loop.call_soon(self.flush)
+        return await asyncio.shield(future)
+
+    def flush(self) -> None:
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._dispatch(batch))
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: Dict[Hashable, asyncio.Future]) -> None:
+        try:
+            found = await self.load_many(list(batch))
+        except Exception as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
@@ -3,7 +3,24 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Every server worker process gets its own connection pools and hasher threads. Their defaults split
+# DATABASE_MAX_CONNECTIONS and the CPUs across SERVER_WORKERS, so the totals do not grow with the worker count.
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+
 DATABASE_URL = os.getenv('DATABASE_URL')
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL') or None
+DATABASE_ECHO = os.getenv('DATABASE_ECHO', 'false').lower() == 'true'
+# Connections all server workers together may open per engine; keep it below Postgres's max_connections
+# (100 by default) minus what the consumer worker, migrations and admin sessions need.
+DATABASE_MAX_CONNECTIONS = int(os.getenv('DATABASE_MAX_CONNECTIONS', 80))
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE') or max(1, DATABASE_MAX_CONNECTIONS // (2 * SERVER_WORKERS)))
+DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW')
+                            or max(0, DATABASE_MAX_CONNECTIONS // SERVER_WORKERS - DATABASE_POOL_SIZE))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 30))
+DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() == 'true'
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv('DATABASE_STATEMENT_CACHE_SIZE', 100))
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
 POSTGRES_USER = os.getenv('POSTGRES_USER')
 POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 POSTGRES_HOST = os.getenv('POSTGRES_HOST')
@@ -19,3 +36,85 @@ RABBITMQ_DEFAULT_PASS = os.getenv('RABBITMQ_DEFAULT_PASS')
 
 RABBITMQ_URL = os.getenv('RABBITMQ_URL')
 QUEUE_NAME = os.getenv('QUEUE_NAME')
+RESET_CODE_QUEUE_NAME = os.getenv('RESET_CODE_QUEUE_NAME', 'password_reset_codes')
+
+PASSWORD_HASHER_EXECUTOR = os.getenv('PASSWORD_HASHER_EXECUTOR', 'thread')
+PASSWORD_HASHER_WORKERS = int(os.getenv('PASSWORD_HASHER_WORKERS') or max(1, (os.cpu_count() or 1) // SERVER_WORKERS))
+PASSWORD_HASHER_MAX_PENDING = int(os.getenv('PASSWORD_HASHER_MAX_PENDING', 64))
+
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 100))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 1000))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 1000))
+SEARCH_CANDIDATE_LIMIT = int(os.getenv('SEARCH_CANDIDATE_LIMIT', 1000))
+
+RABBITMQ_CONNECTION_POOL_SIZE = int(os.getenv('RABBITMQ_CONNECTION_POOL_SIZE', 2))
+RABBITMQ_CHANNEL_POOL_SIZE = int(os.getenv('RABBITMQ_CHANNEL_POOL_SIZE', 10))
+RABBITMQ_PUBLISHER_CONFIRMS = os.getenv('RABBITMQ_PUBLISHER_CONFIRMS', 'true').lower() == 'true'
+RABBITMQ_BATCH_SIZE = int(os.getenv('RABBITMQ_BATCH_SIZE', 100))
+RABBITMQ_BATCH_DELAY_MS = int(os.getenv('RABBITMQ_BATCH_DELAY_MS', 5))
+
+OUTBOX_RELAY_INTERVAL_SECONDS = float(os.getenv('OUTBOX_RELAY_INTERVAL_SECONDS', 1))
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv('OUTBOX_RELAY_BATCH_SIZE', 100))
+
+CONSUMER_PREFETCH = int(os.getenv('CONSUMER_PREFETCH', 100))
+CONSUMER_CONCURRENCY = int(os.getenv('CONSUMER_CONCURRENCY', 20))
+CONSUMER_ACK_BATCH_SIZE = int(os.getenv('CONSUMER_ACK_BATCH_SIZE', 50))
+CONSUMER_ACK_DELAY_MS = int(os.getenv('CONSUMER_ACK_DELAY_MS', 100))
+CONSUMER_RETRY_DELAYS_MS = [int(delay) for delay in
+                            os.getenv('CONSUMER_RETRY_DELAYS_MS', '1000,10000,60000').split(',')]
+CONSUMER_RECONNECT_SECONDS = float(os.getenv('CONSUMER_RECONNECT_SECONDS', 5))
+
+# With an SMTP host the worker mails reset codes; without one POST /users/forgot_password returns the code.
+SMTP_HOST = os.getenv('SMTP_HOST') or None
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_USERNAME = os.getenv('SMTP_USERNAME') or None
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD') or None
+SMTP_FROM = os.getenv('SMTP_FROM', 'no-reply@localhost')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT_SECONDS = float(os.getenv('SMTP_TIMEOUT_SECONDS', 10))
+RESET_CODE_EMAIL_ENABLED = SMTP_HOST is not None
+
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv('USER_CACHE_TTL_SECONDS', 30))
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv('TOKEN_CACHE_MAX_SIZE', 10000))
+TOKEN_INTROSPECT_BATCH_MAX = int(os.getenv('TOKEN_INTROSPECT_BATCH_MAX', 1000))
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv('BULK_IMPORT_BATCH_SIZE', 1000))
+
+USER_BATCH_MAX_IDS = int(os.getenv('USER_BATCH_MAX_IDS', 100))
+USER_BATCH_COALESCE_DELAY_MS = float(os.getenv('USER_BATCH_COALESCE_DELAY_MS', 0))
+
+LOGIN_RATE_LIMIT_ATTEMPTS = int(os.getenv('LOGIN_RATE_LIMIT_ATTEMPTS', 10))
+LOGIN_RATE_LIMIT_IP_ATTEMPTS = int(os.getenv('LOGIN_RATE_LIMIT_IP_ATTEMPTS', 100))
+LOGIN_RATE_LIMIT_WINDOW_SECONDS = float(os.getenv('LOGIN_RATE_LIMIT_WINDOW_SECONDS', 60))
+LOGIN_LOCKOUT_THRESHOLD = int(os.getenv('LOGIN_LOCKOUT_THRESHOLD', 5))
+LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv('LOGIN_LOCKOUT_BASE_SECONDS', 1))
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv('LOGIN_LOCKOUT_MAX_SECONDS', 900))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', 100000))
+TRUST_PROXY_HEADERS = os.getenv('TRUST_PROXY_HEADERS', 'true').lower() == 'true'
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 30))
+REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS = float(os.getenv('REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS', 300))
+REFRESH_TOKEN_PRUNE_BATCH_SIZE = int(os.getenv('REFRESH_TOKEN_PRUNE_BATCH_SIZE', 1000))
+
+FORGOT_PASSWORD_CODE_EXPIRE_MINUTES = int(os.getenv('FORGOT_PASSWORD_CODE_EXPIRE_MINUTES', 15))
+FORGOT_PASSWORD_MAX_ATTEMPTS = int(os.getenv('FORGOT_PASSWORD_MAX_ATTEMPTS', 5))
+FORGOT_PASSWORD_PRUNE_INTERVAL_SECONDS = float(os.getenv('FORGOT_PASSWORD_PRUNE_INTERVAL_SECONDS', 300))
+FORGOT_PASSWORD_PRUNE_BATCH_SIZE = int(os.getenv('FORGOT_PASSWORD_PRUNE_BATCH_SIZE', 1000))
+
+PASSWORD_HASH_SCHEMES = [scheme.strip() for scheme in os.getenv('PASSWORD_HASH_SCHEMES', 'bcrypt').split(',')]
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 1))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 0))
+PROFILER_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILER_SAMPLE_INTERVAL_MS', 5))
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', 80))
+SERVER_KEEPALIVE_SECONDS = int(os.getenv('SERVER_KEEPALIVE_SECONDS', 5))
+SERVER_GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv('SERVER_GRACEFUL_SHUTDOWN_SECONDS', 25))
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
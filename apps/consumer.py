@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aio_pika
+import orjson
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+
+from apps.config import RABBITMQ_URL, RESET_CODE_QUEUE_NAME, CONSUMER_PREFETCH, CONSUMER_CONCURRENCY, \
+    CONSUMER_ACK_BATCH_SIZE, CONSUMER_ACK_DELAY_MS, CONSUMER_RETRY_DELAYS_MS
+from apps.rabbit import Rabbit
+
+logger = logging.getLogger(__name__)
+
+RETRY_COUNT_HEADER = 'x-retry-count'
+
+
+# Delivery channel for reset codes, set by the worker (apps.mail.send_reset_code_email when SMTP is configured).
+reset_code_sender: Optional[Callable[[dict], Awaitable[None]]] = None
+
+
+async def send_reset_code(payload: dict) -> None:
+    if reset_code_sender is None:
+        # Failing sends the message through retry and dead-letter; the code itself must never reach the log.
+        raise RuntimeError('No reset code delivery channel is configured')
+    await reset_code_sender(payload)
+    logger.info('Password reset code sent to %s (expires at %s)', payload['username'], payload['expires_at'])
+
+
+EVENT_HANDLERS: Dict[str, Callable[[dict], Awaitable[None]]] = {
+    'user.password_reset_requested': send_reset_code,
+}
+
+
+async def handle_message(message: AbstractIncomingMessage) -> None:
+    event = orjson.loads(message.body)
+    handler = EVENT_HANDLERS.get(event.get('event')) if isinstance(event, dict) else None
+    if handler is None:
+        # Nothing else should be routed to this queue; fail so the message ends up dead-lettered, not dropped.
+        raise ValueError(f'No handler for message {message.delivery_tag}')
+    await handler(event['payload'])
+
+
+class AckBatcher:
+    """Settle deliveries with one ``multiple=True`` ack per batch.
+
+    Handlers finish out of order, so only the contiguous prefix of settled
+    delivery tags is acked. A nack first flushes the acks before it.
+    """
+
+    def __init__(self, batch_size: int = CONSUMER_ACK_BATCH_SIZE, delay: float = CONSUMER_ACK_DELAY_MS / 1000):
+        self.batch_size = batch_size
+        self.delay = delay
+        self._settled: Dict[int, Tuple[AbstractIncomingMessage, bool]] = {}
+        self._acked_up_to = 0
+        self._pending: Optional[AbstractIncomingMessage] = None
+        self._pending_count = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: set = set()
+
+    async def settle(self, message: AbstractIncomingMessage, ack: bool = True) -> None:
+        self._settled[message.delivery_tag] = (message, ack)
+        while self._acked_up_to + 1 in self._settled:
+            self._acked_up_to += 1
+            next_message, next_ack = self._settled.pop(self._acked_up_to)
+            if next_ack:
+                self._pending = next_message
+                self._pending_count += 1
+            else:
+                await self.flush()
+                await next_message.nack(requeue=True)
+        if self._pending_count >= self.batch_size:
+            await self.flush()
+        elif self._pending is not None and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is None:
+            return
+        message, self._pending, self._pending_count = self._pending, None, 0
+        await message.ack(multiple=True)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+class RabbitConsumer:
+    """Consume RESET_CODE_QUEUE_NAME with bounded concurrency, batched acks and delayed retries.
+
+    A failed message is republished to ``<queue>.retry.<delay_ms>``, a queue
+    whose TTL dead-letters it back to the main queue, once per entry of
+    ``retry_delays``; after that it goes to ``<queue>.dead``. The original
+    delivery is acked only after the copy is published.
+    """
+
+    def __init__(self, handler: Callable[[AbstractIncomingMessage], Awaitable[None]] = handle_message,
+                 queue_name: str = RESET_CODE_QUEUE_NAME, prefetch: int = CONSUMER_PREFETCH,
+                 concurrency: int = CONSUMER_CONCURRENCY, retry_delays: List[int] = CONSUMER_RETRY_DELAYS_MS,
+                 acks: Optional[AckBatcher] = None):
+        self.handler = handler
+        self.queue_name = queue_name
+        self.prefetch = prefetch
+        self.retry_delays = retry_delays
+        self.acks = acks or AckBatcher()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set = set()
+
+    @property
+    def dead_letter_queue(self) -> str:
+        return f'{self.queue_name}.dead'
+
+    def retry_queue(self, delay: int) -> str:
+        return f'{self.queue_name}.retry.{delay}'
+
+    async def declare(self, channel: AbstractChannel):
+        await channel.set_qos(prefetch_count=self.prefetch)
+        for delay in self.retry_delays:
+            await channel.declare_queue(self.retry_queue(delay), durable=True, arguments={
+                'x-message-ttl': delay,
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': self.queue_name,
+            })
+        await channel.declare_queue(self.dead_letter_queue, durable=True)
+        return await channel.declare_queue(self.queue_name, durable=True)
+
+    async def on_message(self, message: AbstractIncomingMessage) -> None:
+        task = asyncio.create_task(self._process(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, message: AbstractIncomingMessage) -> None:
+        async with self._semaphore:
+            try:
+                await self.handler(message)
+            except Exception as exc:
+                try:
+                    await self._retry(message, exc)
+                except Exception:
+                    logger.exception('Could not republish message %s, requeueing it', message.delivery_tag)
+                    await self.acks.settle(message, ack=False)
+                    return
+        await self.acks.settle(message)
+
+    async def _retry(self, message: AbstractIncomingMessage, exc: Exception) -> None:
+        headers = dict(message.headers or {})
+        retries = int(headers.get(RETRY_COUNT_HEADER, 0))
+        headers[RETRY_COUNT_HEADER] = retries + 1
+        if retries < len(self.retry_delays):
+            logger.warning('Message %s failed (%r), retry %d in %d ms', message.delivery_tag, exc, retries + 1,
+                           self.retry_delays[retries])
+            await Rabbit.publish(message.body, self.retry_queue(self.retry_delays[retries]), headers)
+        else:
+            logger.error('Message %s failed (%r) after %d retries, dead-lettering it', message.delivery_tag, exc,
+                         retries)
+            headers['x-error'] = repr(exc)
+            await Rabbit.publish(message.body, self.dead_letter_queue, headers)
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.acks.close()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        connection = await aio_pika.connect(RABBITMQ_URL)
+        connection_lost = asyncio.Event()
+        connection.close_callbacks.add(lambda *args: connection_lost.set())
+        try:
+            channel = await connection.channel()
+            queue = await self.declare(channel)
+            consumer_tag = await queue.consume(self.on_message)
+            waiters = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(connection_lost.wait())]
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            if connection_lost.is_set():
+                raise ConnectionError('RabbitMQ connection lost')
+            await queue.cancel(consumer_tag)
+            await self.drain()
+        finally:
+            await connection.close()
@@ -1,14 +1,214 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Hashable, Optional
+
+from sqlalchemy import delete, event, make_url, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from apps.config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from apps.config import DATABASE_URL, DATABASE_REPLICA_URL, DATABASE_ECHO, DATABASE_POOL_SIZE, \
+    DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT, DATABASE_POOL_RECYCLE, DATABASE_POOL_PRE_PING, \
+    DATABASE_STATEMENT_CACHE_SIZE, READ_YOUR_WRITES_SECONDS, METRICS_ENABLED
+from apps.metrics import record_checkout, record_query
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            record_checkout(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_query(time.perf_counter() - conn.info['query_started'].pop())
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for a failed statement; without this its start time stays on the
+    # pooled connection for good.
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None and conn.info.get('query_started'):
+        record_query(time.perf_counter() - conn.info['query_started'].pop())
+
+
+def build_engine(url: str) -> AsyncEngine:
+    connect_args = {}
+    if make_url(url).get_driver_name() == 'asyncpg':
+        connect_args['prepared_statement_cache_size'] = DATABASE_STATEMENT_CACHE_SIZE
+    new_engine = create_async_engine(
+        url,
+        echo=DATABASE_ECHO,
+        poolclass=TimedQueuePool if METRICS_ENABLED else AsyncAdaptedQueuePool,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_recycle=DATABASE_POOL_RECYCLE,
+        pool_pre_ping=DATABASE_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    if METRICS_ENABLED:
+        event.listen(new_engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(new_engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(new_engine.sync_engine, 'handle_error', _handle_error)
+    return new_engine
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+engine = build_engine(DATABASE_URL)
+replica_engine = build_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
 
 new_session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+new_replica_session = async_sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False)
+# Reads that need no transaction: no BEGIN/ROLLBACK round trips around the query.
+new_autocommit_session = async_sessionmaker(bind=engine.execution_options(isolation_level='AUTOCOMMIT'),
+                                            class_=AsyncSession, expire_on_commit=False)
+new_replica_autocommit_session = async_sessionmaker(
+    bind=replica_engine.execution_options(isolation_level='AUTOCOMMIT'), class_=AsyncSession,
+    expire_on_commit=False
+)
 
 Base = declarative_base()
 
 
+class RecentWrites:
+    def __init__(self, window: float):
+        self.window = window
+        self._items: OrderedDict[Hashable, float] = OrderedDict()
+
+    def add(self, *keys: Hashable) -> None:
+        now = time.monotonic()
+        while self._items:
+            key, written_at = next(iter(self._items.items()))
+            if now - written_at < self.window:
+                break
+            del self._items[key]
+        for key in keys:
+            self._items.pop(key, None)
+            self._items[key] = now
+
+    def __contains__(self, key: Hashable) -> bool:
+        written_at = self._items.get(key)
+        return written_at is not None and time.monotonic() - written_at < self.window
+
+
+recent_writes = RecentWrites(window=READ_YOUR_WRITES_SECONDS)
+_primary_until: ContextVar[float] = ContextVar('primary_until', default=0.0)
+
+
+def mark_write(*keys: Hashable) -> None:
+    _primary_until.set(time.monotonic() + READ_YOUR_WRITES_SECONDS)
+    recent_writes.add(*keys)
+
+
+def new_read_session(*keys: Hashable, autocommit: bool = False) -> AsyncSession:
+    """Session for reads, on the replica unless ``keys`` or this request were written recently.
+
+    ``autocommit`` sessions skip the transaction; server-side cursors (``yield_per`` streams) need one.
+    """
+    primary, replica = (new_autocommit_session, new_replica_autocommit_session) if autocommit \
+        else (new_session, new_replica_session)
+    if replica_engine is engine:
+        return primary()
+    if time.monotonic() < _primary_until.get() or any(key in recent_writes for key in keys):
+        return primary()
+    return replica()
+
+
+class UnitOfWork:
+    """Database session shared by the service calls of one request.
+
+    The session is opened on first use, so requests served from cache never
+    check out a connection. Read-only units use an autocommit session routed
+    like ``new_read_session``; write units use a primary session whose
+    transaction the services commit. ``release()`` hands the connection back
+    to the pool; a later call opens a new session.
+    """
+
+    def __init__(self, read_only: bool = False):
+        self.read_only = read_only
+        self._session: Optional[AsyncSession] = None
+
+    def session(self, *keys: Hashable) -> AsyncSession:
+        if self._session is None:
+            self._session = new_read_session(*keys, autocommit=True) if self.read_only else new_session()
+        return self._session
+
+    async def release(self) -> None:
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+
+@asynccontextmanager
+async def read_session(uow: Optional[UnitOfWork], *keys: Hashable) -> AsyncIterator[AsyncSession]:
+    if uow is None:
+        async with new_read_session(*keys, autocommit=True) as session:
+            yield session
+    else:
+        yield uow.session(*keys)
+
+
+@asynccontextmanager
+async def write_session(uow: Optional[UnitOfWork]) -> AsyncIterator[AsyncSession]:
+    if uow is None:
+        async with new_session() as session:
+            yield session
+    elif uow.read_only:
+        raise RuntimeError('Writes need a unit of work that is not read-only')
+    else:
+        yield uow.session()
+
+
+async def delete_in_batches(model, condition, batch_size: int) -> int:
+    """Delete matching rows ``batch_size`` at a time, one short transaction each, so pruning never holds long locks."""
+    deleted = 0
+    while True:
+        async with new_session() as session:
+            ids = select(model.id).filter(condition).limit(batch_size).scalar_subquery()
+            query = delete(model).filter(model.id.in_(ids)).execution_options(synchronize_session=False)
+            result = await session.execute(query)
+            await session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+
+async def warm_up_engine(target: AsyncEngine, connections: int = DATABASE_POOL_SIZE) -> None:
+    """Open the pool's connections up front so the first requests do not pay for connecting."""
+    async def check_out():
+        conn = await target.connect()
+        await conn.execute(text('SELECT 1'))
+        return conn
+
+    conns = await asyncio.gather(*(check_out() for _ in range(connections)), return_exceptions=True)
+    for conn in conns:
+        if not isinstance(conn, BaseException):
+            await conn.close()
+    for conn in conns:
+        if isinstance(conn, BaseException):
+            raise conn
+
+
+async def warm_up_engines() -> None:
+    await warm_up_engine(engine)
+    if replica_engine is not engine:
+        await warm_up_engine(replica_engine)
+
+
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not engine:
+        await replica_engine.dispose()
@@ -0,0 +1,44 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Iterable, Optional, Tuple
+from uuid import UUID
+
+
+def version_etag(version: int, scope: Optional[UUID] = None) -> str:
+    """ETag of one user's version; ``scope`` keeps URLs shared by several users (``/me``) from colliding."""
+    return f'"{scope}.{version}"' if scope is not None else f'"{version}"'
+
+
+def parse_version_etag(etag: str) -> Optional[int]:
+    """Version from an If-Match ETag; weak ones never match there (strong comparison, RFC 9110)."""
+    etag = etag.strip()
+    if not (len(etag) > 2 and etag.startswith('"') and etag.endswith('"')):
+        return None
+    try:
+        return int(etag[1:-1])
+    except ValueError:
+        return None
+
+
+def page_etag(rows: Iterable[Tuple[UUID, int]], has_more: bool) -> str:
+    """ETag of a list page, derived from the ids and versions of its rows."""
+    digest = hashlib.blake2b(digest_size=16)
+    for user_id, version in rows:
+        digest.update(user_id.bytes)
+        digest.update(version.to_bytes(8, 'big'))
+    digest.update(b'+' if has_more else b'.')
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison as used for If-None-Match."""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(candidate.strip().removeprefix('W/') == etag for candidate in header.split(','))
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
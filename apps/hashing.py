@@ -0,0 +1,112 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from apps.config import PASSWORD_HASHER_EXECUTOR, PASSWORD_HASHER_WORKERS, PASSWORD_HASHER_MAX_PENDING
+from apps.metrics import password_hash_duration
+from apps.models import User
+
+
+def _hash_password(password: str) -> str:
+    return User.get_password_hash(password)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return User.verify_password(plain_password, hashed_password)
+
+
+def _verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return User.verify_and_update_password(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: str = PASSWORD_HASHER_EXECUTOR, workers: int = PASSWORD_HASHER_WORKERS,
+                 max_pending: int = PASSWORD_HASHER_MAX_PENDING):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unknown password hasher executor: {executor!r}')
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+        return self._executor
+
+    def _check_capacity(self) -> None:
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Server is busy, try again later',
+                headers={'Retry-After': '1'}
+            )
+
+    async def _run(self, operation: str, func, *args):
+        self._check_capacity()
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            password_hash_duration.observe(time.perf_counter() - started, operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', _hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run('verify', _verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run('verify', _verify_and_update_password, plain_password, hashed_password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a bulk batch without starving interactive hashes.
+
+        Hashes are submitted in rounds of at most ``workers`` (fewer when the
+        backlog is near ``max_pending``), and every queued one counts in
+        ``pending``. A login queued behind a bulk import waits for one round,
+        not the whole batch, and the 503 keeps reflecting the real backlog.
+        """
+        hashed: List[str] = []
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            while len(hashed) < len(passwords):
+                size = max(1, min(self.workers, self.max_pending - self.pending))
+                chunk = passwords[len(hashed):len(hashed) + size]
+                self.pending += len(chunk)
+                try:
+                    hashed += await asyncio.gather(
+                        *(loop.run_in_executor(self.executor, _hash_password, password) for password in chunk)
+                    )
+                finally:
+                    self.pending -= len(chunk)
+            return hashed
+        finally:
+            password_hash_duration.observe(time.perf_counter() - started, 'hash_many')
+
+    async def warm_up(self) -> None:
+        """Start every executor worker and load the hash backend before real logins need them."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.executor, _hash_password, 'warm-up') for _ in range(self.workers))
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
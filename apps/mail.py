@@ -0,0 +1,30 @@
+import asyncio
+import smtplib
+from email.message import EmailMessage
+
+from apps.config import SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_FROM, SMTP_STARTTLS, \
+    SMTP_TIMEOUT_SECONDS
+
+
+def _send(message: EmailMessage) -> None:
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USERNAME:
+            smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        smtp.send_message(message)
+
+
+async def send_mail(to: str, subject: str, text: str) -> None:
+    message = EmailMessage()
+    message['From'] = SMTP_FROM
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(text)
+    await asyncio.to_thread(_send, message)
+
+
+async def send_reset_code_email(payload: dict) -> None:
+    await send_mail(payload['email'], 'Password reset code',
+                    f"Hello {payload['username']},\n\n"
+                    f"your password reset code is {payload['code']}. It expires at {payload['expires_at']}.\n")
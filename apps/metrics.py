@@ -0,0 +1,240 @@
+import bisect
+import logging
+import sys
+import threading
+import time
+from collections import Counter as StackCounter, deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from apps.config import METRICS_ENABLED, SLOW_REQUEST_SECONDS, PROFILER_SAMPLE_INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then +Inf count, then sum.
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            cumulative += values[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    def __init__(self, name: str, documentation: str, metric_type: str, func: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.func = func
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}',
+                f'{self.name} {self.func()}']
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def callback(self, *args, **kwargs) -> CallbackMetric:
+        return self.register(CallbackMetric(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route and status', ('method', 'route', 'status')
+)
+db_query_duration = registry.histogram('db_query_duration_seconds', 'Time spent executing SQL statements')
+db_queries_per_request = registry.histogram(
+    'db_queries_per_request', 'SQL statements executed per HTTP request', ('route',), buckets=COUNT_BUCKETS
+)
+db_query_time_per_request = registry.histogram(
+    'db_query_time_per_request_seconds', 'Total SQL time per HTTP request', ('route',)
+)
+db_pool_checkout_wait = registry.histogram('db_pool_checkout_wait_seconds', 'Time waiting for a pooled connection')
+db_pool_checkouts_per_request = registry.histogram(
+    'db_pool_checkouts_per_request', 'Connection pool checkouts per HTTP request', ('route',), buckets=COUNT_BUCKETS
+)
+password_hash_duration = registry.histogram(
+    'password_hash_duration_seconds', 'Password hash and verify time', ('operation',)
+)
+rabbit_publish_duration = registry.histogram(
+    'rabbit_publish_duration_seconds', 'RabbitMQ publish latency including confirms', ('operation',)
+)
+outbox_lag = registry.histogram(
+    'outbox_lag_seconds', 'Time from an outbox row being written to its publish being confirmed',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time', 'checkouts')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.checkouts = 0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def record_query(duration: float) -> None:
+    db_query_duration.observe(duration)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += duration
+
+
+def record_checkout(wait: float) -> None:
+    db_pool_checkout_wait.observe(wait)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.checkouts += 1
+
+
+class SlowRequestProfiler:
+    """Sample the event loop thread's stack and log where slow requests spent their time.
+
+    Samples are taken from the loop thread as a whole, so with concurrent
+    requests the report shows what the process was doing during the slow
+    request, not only that request's frames.
+    """
+
+    def __init__(self, threshold: float, interval: float, max_depth: int = 40, max_samples: int = 20000):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._target_thread_id: Optional[int] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._target_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name='slow-request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_filename}:{frame.f_lineno}:{code.co_name}')
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def report(self, method: str, route: str, started: float, finished: float) -> None:
+        if self._thread is None or finished - started < self.threshold:
+            return
+        stacks = StackCounter(stack for sampled_at, stack in list(self._samples) if started <= sampled_at <= finished)
+        lines = [f'Slow request {method} {route} took {(finished - started) * 1000:.1f} ms, '
+                 f'{sum(stacks.values())} samples']
+        for stack, count in stacks.most_common(5):
+            lines.append(f'  {count} samples:')
+            lines.extend(f'    {frame}' for frame in stack[-10:])
+        logger.warning('\n'.join(lines))
+
+
+slow_request_profiler = SlowRequestProfiler(SLOW_REQUEST_SECONDS, PROFILER_SAMPLE_INTERVAL_MS / 1000)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            request_stats.reset(token)
+            route = scope.get('route')
+            route_path = route.path if route is not None else 'unmatched'
+            http_request_duration.observe(finished - started, scope['method'], route_path, str(status_code))
+            db_queries_per_request.observe(stats.queries, route_path)
+            db_query_time_per_request.observe(stats.query_time, route_path)
+            db_pool_checkouts_per_request.observe(stats.checkouts, route_path)
+            if SLOW_REQUEST_SECONDS:
+                slow_request_profiler.report(scope['method'], route_path, started, finished)
@@ -1,30 +1,54 @@
 import uuid
 
 from datetime import timedelta, datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import jwt
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from sqlalchemy import Column, String, UUID, Integer, ForeignKey
+from sqlalchemy import Column, String, UUID, Integer, BigInteger, ForeignKey, Index, DateTime, DDL, event, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
-from apps.config import SECRET_KEY, ALGORITHM
+from apps.config import SECRET_KEY, ALGORITHM, PASSWORD_HASH_SCHEMES, BCRYPT_ROUNDS, ARGON2_TIME_COST, \
+    ARGON2_MEMORY_COST, ARGON2_PARALLELISM
 from apps.database import Base
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+def build_password_context(schemes: List[str], bcrypt_rounds: int = BCRYPT_ROUNDS,
+                           argon2_time_cost: int = ARGON2_TIME_COST, argon2_memory_cost: int = ARGON2_MEMORY_COST,
+                           argon2_parallelism: int = ARGON2_PARALLELISM) -> CryptContext:
+    settings = {}
+    if 'bcrypt' in schemes:
+        # Pinning min and max to the default makes hashes with any other cost "need update".
+        settings.update(bcrypt__rounds=bcrypt_rounds, bcrypt__min_rounds=bcrypt_rounds,
+                        bcrypt__max_rounds=bcrypt_rounds)
+    if 'argon2' in schemes:
+        settings.update(argon2__time_cost=argon2_time_cost, argon2__memory_cost=argon2_memory_cost,
+                        argon2__parallelism=argon2_parallelism)
+    return CryptContext(schemes=schemes, deprecated='auto', **settings)
+
+
+pwd_context = build_password_context(PASSWORD_HASH_SCHEMES)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = tuple(
+        # Trigram indexes for substring and fuzzy search.
+        Index(f'ix_users_{column}_trgm', column, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+        for column in ('username', 'email', 'fullname')
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    username = Column(String(100), nullable=False)
+    username = Column(String(100), unique=True, index=True, nullable=False)
     fullname = Column(String(100), nullable=False)
     email = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    forgot_password = relationship('UserForgotPassword', uselist=False, back_populates='user')
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    forgot_password = relationship('UserForgotPassword', uselist=False, back_populates='user', passive_deletes=True)
 
     @classmethod
     def get_password_hash(cls, password):
@@ -34,6 +58,10 @@ class User(Base):
     def verify_password(cls, plain_password, hashed_password):
         return pwd_context.verify(plain_password, hashed_password)
 
+    @classmethod
+    def verify_and_update_password(cls, plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
     @classmethod
     def authenticate_user(cls, user, password):
         if not user:
@@ -54,12 +82,44 @@ class User(Base):
         return encoded_jwt
 
 
+# Case-insensitive prefix matches for autocomplete.
+Index('ix_users_username_lower_pattern', func.lower(User.username).label('username_lower'),
+      postgresql_ops={'username_lower': 'text_pattern_ops'})
+event.listen(User.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
 class UserForgotPassword(Base):
     __tablename__ = 'users_forgot_password'
+    __table_args__ = (
+        Index('ix_users_forgot_password_username_code_expires_at', 'username', 'code', 'expires_at'),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     username = Column(String(100), nullable=False)
     code = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
 
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), unique=True, index=True)
     user = relationship('User', back_populates='forgot_password')
+
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), index=True, nullable=False)
+
+
+class OutboxMessage(Base):
+    __tablename__ = 'outbox'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,82 @@
+import logging
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import List
+
+import orjson
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from apps.config import OUTBOX_RELAY_INTERVAL_SECONDS, OUTBOX_RELAY_BATCH_SIZE, QUEUE_NAME, RESET_CODE_QUEUE_NAME, \
+    RESET_CODE_EMAIL_ENABLED
+from apps.database import new_session
+from apps.metrics import outbox_lag
+from apps.models import OutboxMessage
+from apps.rabbit import Rabbit
+from apps.tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+# Events that only the worker consumes get their own queue; everything else goes to QUEUE_NAME.
+EVENT_ROUTING_KEYS = {
+    'user.password_reset_requested': RESET_CODE_QUEUE_NAME,
+} if RESET_CODE_EMAIL_ENABLED else {}
+
+
+def routing_key(event: str) -> str:
+    return EVENT_ROUTING_KEYS.get(event, QUEUE_NAME)
+
+
+async def add_events(session: AsyncSession, event: str, payloads: List[dict]) -> None:
+    """Queue events for publishing; they are only relayed if the caller's transaction commits."""
+    if payloads:
+        await session.execute(insert(OutboxMessage).values([{'event': event, 'payload': payload}
+                                                             for payload in payloads]))
+
+
+async def add_event(session: AsyncSession, event: str, payload: dict) -> None:
+    await add_events(session, event, [payload])
+
+
+async def relay_outbox() -> int:
+    """Publish pending outbox rows in id order and delete the confirmed ones.
+
+    Rows are locked with SKIP LOCKED, so several workers can relay concurrently
+    without publishing the same row twice; ordering is then only per worker.
+    Delivery is at least once: consumers should dedupe on the message id.
+    """
+    relayed = 0
+    while True:
+        async with new_session() as session:
+            query = select(OutboxMessage.id, OutboxMessage.event, OutboxMessage.payload, OutboxMessage.created_at) \
+                .order_by(OutboxMessage.id).limit(OUTBOX_RELAY_BATCH_SIZE).with_for_update(skip_locked=True)
+            rows = (await session.execute(query)).all()
+            if not rows:
+                return relayed
+            published = []
+            for key, group in groupby(rows, key=lambda row: routing_key(row.event)):
+                group = list(group)
+                results = await Rabbit.publish_many(
+                    [orjson.dumps({'id': row.id, 'event': row.event, 'payload': row.payload}) for row in group], key
+                )
+                published += [row for row, result in zip(group, results) if not isinstance(result, BaseException)]
+            if published:
+                await session.execute(
+                    delete(OutboxMessage).filter(OutboxMessage.id.in_([row.id for row in published]))
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        now = datetime.now(timezone.utc)
+        for row in published:
+            outbox_lag.observe((now - row.created_at).total_seconds())
+        relayed += len(published)
+        if len(published) < len(rows):
+            logger.warning('Outbox relay: %d of %d messages were not confirmed, retrying later',
+                           len(rows) - len(published), len(rows))
+            return relayed
+        if len(rows) < OUTBOX_RELAY_BATCH_SIZE:
+            return relayed
+
+
+outbox_relay = PeriodicTask('outbox-relay', relay_outbox, OUTBOX_RELAY_INTERVAL_SECONDS)
@@ -0,0 +1,22 @@
+import base64
+import binascii
+import uuid
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(last_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(last_id.bytes).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[uuid.UUID]:
+    if cursor is None:
+        return None
+    try:
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor!'
+        )
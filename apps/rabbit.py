@@ -1,32 +1,156 @@
-from apps.config import RABBITMQ_URL, QUEUE_NAME
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from apps.config import RABBITMQ_URL, QUEUE_NAME, RESET_CODE_QUEUE_NAME, RABBITMQ_CONNECTION_POOL_SIZE, \
+    RABBITMQ_CHANNEL_POOL_SIZE, RABBITMQ_PUBLISHER_CONFIRMS, RABBITMQ_BATCH_SIZE, RABBITMQ_BATCH_DELAY_MS
 import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractConnection
+from aio_pika.pool import Pool
 
+from apps.metrics import rabbit_publish_duration
 from apps.schemas import MessageSchema
 
 
+class RabbitBatchPublisher:
+    def __init__(self, max_size: int = RABBITMQ_BATCH_SIZE, max_delay: float = RABBITMQ_BATCH_DELAY_MS / 1000,
+                 routing_key: str = QUEUE_NAME):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.routing_key = routing_key
+        self._buffer: List[Tuple[bytes, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: set = set()
+
+    async def publish(self, body: bytes) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((body, future))
+        if len(self._buffer) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+        await future
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        task = asyncio.create_task(self._send(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]) -> None:
+        try:
+            results = await Rabbit.publish_many([body for body, _ in batch], self.routing_key)
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(None)
+
+    async def close(self) -> None:
+        self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
 class Rabbit:
+    connection_pool: Optional[Pool] = None
+    channel_pool: Optional[Pool] = None
+    batch_publisher: Optional[RabbitBatchPublisher] = None
+    _declared_queues: set = set()
+
     @classmethod
-    async def get_rabbit_connection(cls):
+    async def get_rabbit_connection(cls) -> AbstractConnection:
         return await aio_pika.connect_robust(RABBITMQ_URL)
 
+    @classmethod
+    async def get_channel(cls) -> AbstractChannel:
+        async with cls.connection_pool.acquire() as connection:
+            channel = await connection.channel(publisher_confirms=RABBITMQ_PUBLISHER_CONFIRMS)
+        for queue_name in (QUEUE_NAME, RESET_CODE_QUEUE_NAME):
+            if queue_name not in cls._declared_queues:
+                await channel.declare_queue(queue_name, durable=True)
+                cls._declared_queues.add(queue_name)
+        return channel
+
+    @classmethod
+    async def connect(cls) -> None:
+        if cls.channel_pool is not None:
+            return
+        cls.connection_pool = Pool(cls.get_rabbit_connection, max_size=RABBITMQ_CONNECTION_POOL_SIZE)
+        cls.channel_pool = Pool(cls.get_channel, max_size=RABBITMQ_CHANNEL_POOL_SIZE)
+        cls.batch_publisher = RabbitBatchPublisher()
+
+    @classmethod
+    async def warm_up(cls) -> None:
+        await cls.connect()
+        async with cls.channel_pool.acquire():
+            pass
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls.channel_pool is None:
+            return
+        await cls.batch_publisher.close()
+        await cls.channel_pool.close()
+        await cls.connection_pool.close()
+        cls.connection_pool = cls.channel_pool = cls.batch_publisher = None
+        cls._declared_queues = set()
+
     @classmethod
     async def setup_rabbitmq(cls):
-        connection = await cls.get_rabbit_connection()
-        async with connection:
-            async with connection.channel() as channel:
-                await channel.default_exchange.publish(
-                    aio_pika.Message(body=b'Hello RabbitMQ'),
-                    routing_key=QUEUE_NAME
-                )
+        await cls.publish(b'Hello RabbitMQ')
+
+    @staticmethod
+    def message(body: bytes, headers: Optional[dict] = None) -> aio_pika.Message:
+        # Persistent, so a confirm means the broker has stored the message: the outbox deletes its row on confirm
+        # and consumer retries ack the original once the copy is confirmed.
+        return aio_pika.Message(body=body, headers=headers, delivery_mode=aio_pika.DeliveryMode.PERSISTENT)
+
+    @classmethod
+    async def publish(cls, body: bytes, routing_key: str = QUEUE_NAME, headers: Optional[dict] = None) -> None:
+        await cls.connect()
+        started = time.perf_counter()
+        async with cls.channel_pool.acquire() as channel:
+            # Confirms are pipelined per channel: hold it only to start the publish, not for the round trip.
+            confirmation = asyncio.ensure_future(
+                channel.default_exchange.publish(cls.message(body, headers), routing_key=routing_key)
+            )
+        await confirmation
+        rabbit_publish_duration.observe(time.perf_counter() - started, 'publish')
+
+    @classmethod
+    async def publish_many(cls, bodies: List[bytes], routing_key: str = QUEUE_NAME) -> list:
+        await cls.connect()
+        started = time.perf_counter()
+        async with cls.channel_pool.acquire() as channel:
+            confirmations = asyncio.gather(
+                *(channel.default_exchange.publish(cls.message(body), routing_key=routing_key)
+                  for body in bodies),
+                return_exceptions=True
+            )
+        results = await confirmations
+        rabbit_publish_duration.observe(time.perf_counter() - started, 'publish_many')
+        return results
+
+    @classmethod
+    async def publish_batch(cls, bodies: List[bytes], routing_key: str = QUEUE_NAME) -> None:
+        results = await cls.publish_many(bodies, routing_key)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return None
 
     @classmethod
     async def send_message(cls, message: MessageSchema) -> None:
-        connection = await cls.get_rabbit_connection()
-        async with connection:
-            async with connection.channel() as channel:
-                queue = await channel.declare_queue(QUEUE_NAME, durable=True)
-                await channel.default_exchange.publish(
-                    aio_pika.Message(body=message.text.encode()),
-                    routing_key=QUEUE_NAME
-                )
+        await cls.connect()
+        await cls.batch_publisher.publish(message.text.encode())
         return None
@@ -1,81 +1,241 @@
-from fastapi import APIRouter, Depends, status
-from typing import Annotated, List
+from fastapi import APIRouter, Cookie, Depends, Header, HTTPException, Query, Request, status
+from typing import Annotated, AsyncIterator, List, Literal, Optional
+from uuid import UUID
 
 from pydantic import UUID4
-from starlette.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from apps.auth import get_current_token_payload, introspect_token
+from apps.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, REFRESH_TOKEN_EXPIRE_DAYS, SEARCH_CANDIDATE_LIMIT
+from apps.database import UnitOfWork
+from apps.etags import version_etag, parse_version_etag, etag_matches, http_date
+from apps.metrics import registry
 
 from apps.rabbit import Rabbit
 from apps.schemas import UserCreateSchema, UserLoginSchema, UserUpdateSchema, UserForgotPasswordSchema, \
-    UserPasswordResetSchema, UserGetSchema, UserForgotPWSGetSchema, MessageSchema
-from apps.services import UserService, UserForgotPWService
+    UserPasswordResetSchema, UserGetSchema, MessageSchema, UserPageSchema, UserForgotPWSPageSchema, \
+    TokenIntrospectSchema, TokenBatchIntrospectSchema, TokenIntrospectionSchema, UserBulkImportReportSchema, \
+    UserBatchGetSchema, UserBatchSchema, UserSearchPageSchema
+from apps.services import UserService, UserForgotPWService, RefreshTokenService
+from apps.streaming import gzip_stream
+from apps.throttling import login_throttle, get_client_ip
 
 user_router = APIRouter(prefix='/users', tags=['users'])
 user_forgot_pw_router = APIRouter(prefix='/users_forgot_pw', tags=['users_forgot_passwords'])
+token_router = APIRouter(prefix='/token', tags=['token'])
+metrics_router = APIRouter(tags=['metrics'])
+
+
+async def read_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    uow = UnitOfWork(read_only=True)
+    try:
+        yield uow
+    finally:
+        await uow.release()
+
+
+async def write_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    uow = UnitOfWork()
+    try:
+        yield uow
+    finally:
+        await uow.release()
+
+
+PageLimit = Annotated[int, Query(ge=1, le=PAGE_SIZE_MAX)]
+IfNoneMatch = Annotated[Optional[str], Header()]
+IfMatch = Annotated[Optional[str], Header()]
+ReadUnitOfWork = Annotated[UnitOfWork, Depends(read_unit_of_work)]
+WriteUnitOfWork = Annotated[UnitOfWork, Depends(write_unit_of_work)]
+
+
+def set_auth_cookies(response: Response, access_token: str, refresh_token: str) -> None:
+    response.set_cookie(key='access_token', value=access_token, httponly=True)
+    response.set_cookie(key='refresh_token', value=refresh_token, httponly=True, path='/users',
+                        max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60)
+
+
+def not_modified(etag: str, last_modified: Optional[str] = None, headers: Optional[dict] = None) -> Response:
+    headers = {**(headers or {}), 'ETag': etag}
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+async def get_user_response(user_id: UUID, if_none_match: Optional[str], uow: UnitOfWork,
+                            current_user: bool = False) -> Response:
+    # /me serves a different user per credentials: scope its ETag to the user and tell caches so.
+    scope = user_id if current_user else None
+    headers = {'Vary': 'Authorization, Cookie'} if current_user else {}
+    min_version = None
+    if if_none_match:
+        version, updated_at = await UserService.get_user_version(user_id, uow)
+        await uow.release()
+        if etag_matches(if_none_match, version_etag(version, scope)):
+            return not_modified(version_etag(version, scope), http_date(updated_at), headers)
+        min_version = version
+    user = await UserService.get_user_by_id(user_id, min_version)
+    return ORJSONResponse(content=user, headers={**headers, 'ETag': version_etag(user['version'], scope),
+                                                 'Last-Modified': http_date(user['updated_at'])})
+
+
+@user_router.get('', response_model=UserPageSchema, status_code=status.HTTP_200_OK)
+async def get_all_users(uow: ReadUnitOfWork, limit: PageLimit = PAGE_SIZE_DEFAULT, after: Optional[str] = None,
+                        stream: bool = False, if_none_match: IfNoneMatch = None) -> Response:
+    if stream:
+        return StreamingResponse(UserService.stream_users(), media_type='application/x-ndjson')
+    if if_none_match:
+        etag = await UserService.get_users_etag(limit, after, uow)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    users, etag = await UserService.get_users(limit, after, uow)
+    return Response(content=users, media_type='application/json', headers={'ETag': etag})
+
+
+@user_router.get('/export')
+async def export_users(export_format: Annotated[Literal['ndjson', 'csv'], Query(alias='format')] = 'ndjson',
+                       gzip: bool = False) -> StreamingResponse:
+    media_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    chunks = UserService.export_users(export_format)
+    headers = {'Content-Disposition': f'attachment; filename="users.{export_format}"'}
+    if gzip:
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
 
+@user_router.get('/search', response_model=UserSearchPageSchema, status_code=status.HTTP_200_OK)
+async def search_users(q: Annotated[str, Query(min_length=1, max_length=100)], uow: ReadUnitOfWork,
+                       limit: PageLimit = PAGE_SIZE_DEFAULT,
+                       offset: Annotated[int, Query(ge=0, le=SEARCH_CANDIDATE_LIMIT)] = 0) -> Response:
+    users = await UserService.search_users(q, limit, offset, uow)
+    return Response(content=users, media_type='application/json')
 
-@user_router.get('', response_model=List[UserGetSchema], status_code=status.HTTP_200_OK)
-async def get_all_users():
-    users = await UserService.get_users()
-    return users
+
+@user_router.get('/me', response_model=UserGetSchema, status_code=status.HTTP_200_OK)
+async def get_current_user(payload: Annotated[dict, Depends(get_current_token_payload)], uow: ReadUnitOfWork,
+                           if_none_match: IfNoneMatch = None) -> Response:
+    return await get_user_response(UUID(payload['user_id']), if_none_match, uow, current_user=True)
 
 
 @user_router.get('/{user_id}', response_model=UserGetSchema, status_code=status.HTTP_200_OK)
-async def get_user_by_id(user_id: UUID4) -> UserGetSchema:
-    user = await UserService.get_user_by_id(user_id)
-    return user
+async def get_user_by_id(user_id: UUID4, uow: ReadUnitOfWork, if_none_match: IfNoneMatch = None) -> Response:
+    return await get_user_response(user_id, if_none_match, uow)
 
 
 @user_router.post('')
-async def create_user(user: Annotated[UserCreateSchema, Depends()]) -> JSONResponse:
-    await UserService.create_user(user)
+async def create_user(user: Annotated[UserCreateSchema, Depends()], uow: WriteUnitOfWork) -> JSONResponse:
+    await UserService.create_user(user, uow)
     response = JSONResponse(content={'message': 'user is created successfully'},
                             status_code=status.HTTP_201_CREATED)
     return response
 
 
+@user_router.post('/bulk', response_model=UserBulkImportReportSchema, status_code=status.HTTP_200_OK)
+async def bulk_create_users(request: Request) -> UserBulkImportReportSchema:
+    report = await UserService.bulk_create_users(request.stream())
+    return report
+
+
+@user_router.post('/batch', response_model=UserBatchSchema, status_code=status.HTTP_200_OK)
+async def get_users_by_ids(data: UserBatchGetSchema, uow: ReadUnitOfWork) -> Response:
+    users = await UserService.get_users_by_ids(data.ids, uow)
+    return Response(content=users, media_type='application/json')
+
+
 @user_router.put('/{user_id}')
-async def update_user(user_id: UUID4, user: Annotated[UserUpdateSchema, Depends()]) -> JSONResponse:
-    await UserService.update_user(user_id, user)
+async def update_user(user_id: UUID4, user: Annotated[UserUpdateSchema, Depends()],
+                      uow: WriteUnitOfWork, if_match: IfMatch = None) -> JSONResponse:
+    expected_version = None
+    if if_match and if_match.strip() != '*':
+        expected_version = parse_version_etag(if_match)
+        if expected_version is None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail='User was modified by another request!'
+            )
+    version, updated_at = await UserService.update_user(user_id, user, expected_version, uow)
     response = JSONResponse(content={'message': 'user updated successfully!'},
-                            status_code=status.HTTP_200_OK)
+                            status_code=status.HTTP_200_OK,
+                            headers={'ETag': version_etag(version), 'Last-Modified': http_date(updated_at)})
     return response
 
 
 @user_router.delete('/{user_id}')
-async def delete_user(user_id: UUID4) -> JSONResponse:
-    await UserService.delete_user(user_id)
+async def delete_user(user_id: UUID4, uow: WriteUnitOfWork) -> JSONResponse:
+    await UserService.delete_user(user_id, uow)
     response = JSONResponse(content={'message': 'User deleted successfully'},
                             status_code=status.HTTP_204_NO_CONTENT)
     return response
 
 
 @user_router.post('/login')
-async def user_login(user_data: Annotated[UserLoginSchema, Depends()]):
-    access_token = await UserService.user_login(user_data)
+async def user_login(request: Request, user_data: Annotated[UserLoginSchema, Depends()], uow: WriteUnitOfWork):
+    await login_throttle.check(user_data.username, get_client_ip(request))
+    try:
+        access_token, refresh_token = await UserService.user_login(user_data, uow)
+    except HTTPException as exc:
+        if exc.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_404_NOT_FOUND):
+            await login_throttle.failure(user_data.username)
+        raise
+    await login_throttle.success(user_data.username)
     response = JSONResponse(content={'message': 'login successful'}, status_code=status.HTTP_200_OK)
-    response.set_cookie(key='access_token', value=access_token, httponly=True)
+    set_auth_cookies(response, access_token, refresh_token)
+    return response
+
+
+@user_router.post('/refresh')
+async def refresh_access_token(uow: WriteUnitOfWork,
+                               refresh_token: Annotated[Optional[str], Cookie()] = None) -> JSONResponse:
+    if not refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Invalid refresh token',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    access_token, refresh_token = await RefreshTokenService.refresh(refresh_token, uow)
+    response = JSONResponse(content={'message': 'token refreshed'}, status_code=status.HTTP_200_OK)
+    set_auth_cookies(response, access_token, refresh_token)
+    return response
+
+
+@user_router.post('/logout')
+async def user_logout(uow: WriteUnitOfWork, refresh_token: Annotated[Optional[str], Cookie()] = None) -> JSONResponse:
+    if refresh_token:
+        await RefreshTokenService.revoke(refresh_token, uow)
+    response = JSONResponse(content={'message': 'logout successful'}, status_code=status.HTTP_200_OK)
+    response.delete_cookie(key='access_token')
+    response.delete_cookie(key='refresh_token', path='/users')
     return response
 
 
 @user_router.post('/forgot_password')
-async def user_forgot_password(username: Annotated[UserForgotPasswordSchema, Depends()]) -> JSONResponse:
-    code = await UserService.user_forgot_password(username)
-    response = JSONResponse(content={'code': code}, status_code=status.HTTP_201_CREATED)
+async def user_forgot_password(username: Annotated[UserForgotPasswordSchema, Depends()],
+                               uow: WriteUnitOfWork) -> JSONResponse:
+    code = await UserService.user_forgot_password(username, uow)
+    if code is not None:
+        # No delivery channel is configured; hand the code back as before.
+        return JSONResponse(content={'code': code}, status_code=status.HTTP_201_CREATED)
+    response = JSONResponse(content={'message': 'reset code is sent'}, status_code=status.HTTP_202_ACCEPTED)
     return response
 
 
 @user_router.post('/reset_password')
-async def reset_password(data: Annotated[UserPasswordResetSchema, Depends()]) -> JSONResponse:
-    await UserService.password_reset(data)
+async def reset_password(data: Annotated[UserPasswordResetSchema, Depends()], uow: WriteUnitOfWork) -> JSONResponse:
+    await UserService.password_reset(data, uow)
     response = JSONResponse(content={'message': 'password is changed successfully'},
                             status_code=status.HTTP_200_OK)
     return response
 
 
-@user_forgot_pw_router.get('', response_model=List[UserForgotPWSGetSchema])
-async def get_all_users_forgot_pw() -> List[UserForgotPWSGetSchema]:
-    forgot_pw_users = await UserForgotPWService.user_forgot_pw_get_all()
-    return forgot_pw_users
+@user_forgot_pw_router.get('', response_model=UserForgotPWSPageSchema)
+async def get_all_users_forgot_pw(uow: ReadUnitOfWork, limit: PageLimit = PAGE_SIZE_DEFAULT,
+                                  after: Optional[str] = None, stream: bool = False) -> Response:
+    if stream:
+        return StreamingResponse(UserForgotPWService.stream_user_forgot_pw(), media_type='application/x-ndjson')
+    forgot_pw_users = await UserForgotPWService.user_forgot_pw_get_all(limit, after, uow)
+    return Response(content=forgot_pw_users, media_type='application/json')
 
 
 @user_router.post('/send_message')
@@ -83,3 +243,18 @@ async def send_message(message: Annotated[MessageSchema, Depends()]) -> JSONResp
     await Rabbit.send_message(message)
     response = JSONResponse(content={'message': 'message is sanded'}, status_code=status.HTTP_200_OK)
     return response
+
+
+@token_router.post('/introspect', response_model=TokenIntrospectionSchema)
+async def introspect(data: TokenIntrospectSchema) -> TokenIntrospectionSchema:
+    return introspect_token(data.token)
+
+
+@token_router.post('/introspect/batch', response_model=List[TokenIntrospectionSchema])
+async def introspect_batch(data: TokenBatchIntrospectSchema) -> List[TokenIntrospectionSchema]:
+    return [introspect_token(token) for token in data.tokens]
+
+
+@metrics_router.get('/metrics', include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
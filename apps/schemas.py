@@ -1,4 +1,9 @@
-from pydantic import BaseModel, ConfigDict, UUID4
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, UUID4
+
+from apps.config import TOKEN_INTROSPECT_BATCH_MAX, USER_BATCH_MAX_IDS
 
 
 class UserCreateSchema(BaseModel):
@@ -13,10 +18,45 @@ class UserGetSchema(BaseModel):
     username: str
     fullname: str
     email: str
+    version: int
+    updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserPageSchema(BaseModel):
+    items: List[UserGetSchema]
+    next_cursor: Optional[str] = None
+
+
+class UserSearchPageSchema(BaseModel):
+    items: List[UserGetSchema]
+    next_offset: Optional[int] = None
+
+
+class UserBatchGetSchema(BaseModel):
+    ids: List[UUID4] = Field(min_length=1, max_length=USER_BATCH_MAX_IDS)
+
+
+class UserBatchSchema(BaseModel):
+    users: List[UserGetSchema]
+    missing: List[UUID4]
+
+
+class UserBulkImportRowSchema(BaseModel):
+    line: int
+    status: str
+    id: Optional[UUID4] = None
+    error: Optional[str] = None
+
+
+class UserBulkImportReportSchema(BaseModel):
+    created: int = 0
+    conflicts: int = 0
+    invalid: int = 0
+    rows: List[UserBulkImportRowSchema] = []
+
+
 class UserUpdateSchema(BaseModel):
     username: str
     fullname: str
@@ -42,11 +82,32 @@ class UserPasswordResetSchema(BaseModel):
 class UserForgotPWSGetSchema(BaseModel):
     id: UUID4
     username: str
-    code: int
+    expires_at: datetime
+    attempts: int
     user_id: UUID4
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserForgotPWSPageSchema(BaseModel):
+    items: List[UserForgotPWSGetSchema]
+    next_cursor: Optional[str] = None
+
+
 class MessageSchema(BaseModel):
     text: str
+
+
+class TokenIntrospectSchema(BaseModel):
+    token: str
+
+
+class TokenBatchIntrospectSchema(BaseModel):
+    tokens: List[str] = Field(max_length=TOKEN_INTROSPECT_BATCH_MAX)
+
+
+class TokenIntrospectionSchema(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    user_id: Optional[UUID4] = None
+    exp: Optional[int] = None
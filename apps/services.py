@@ -1,193 +1,554 @@
+import csv
+import hashlib
+import io
 import random
-from datetime import timedelta
-from typing import List
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+import orjson
 from fastapi import HTTPException, status
-from fastapi.encoders import jsonable_encoder
-from pydantic import UUID4
+from pydantic import UUID4, ValidationError
 
-from apps.config import ACCESS_TOKEN_EXPIRE_MINUTES
-from apps.models import User, UserForgotPassword
-from apps.database import new_session
-from apps.schemas import UserGetSchema, UserCreateSchema, UserLoginSchema, UserUpdateSchema, UserForgotPasswordSchema, \
-    UserForgotPWSGetSchema, UserPasswordResetSchema
+from apps.cache import user_cache
+from apps.coalescer import BatchCoalescer
+from apps.config import ACCESS_TOKEN_EXPIRE_MINUTES, STREAM_CHUNK_SIZE, BULK_IMPORT_BATCH_SIZE, USER_BATCH_MAX_IDS, \
+    USER_BATCH_COALESCE_DELAY_MS, REFRESH_TOKEN_EXPIRE_DAYS, REFRESH_TOKEN_PRUNE_BATCH_SIZE, \
+    FORGOT_PASSWORD_CODE_EXPIRE_MINUTES, FORGOT_PASSWORD_MAX_ATTEMPTS, FORGOT_PASSWORD_PRUNE_BATCH_SIZE, \
+    SEARCH_CANDIDATE_LIMIT, RESET_CODE_EMAIL_ENABLED
+from apps.hashing import password_hasher
+from apps.models import User, UserForgotPassword, RefreshToken
+from apps.outbox import add_event, add_events, outbox_relay
+from apps.database import UnitOfWork, new_session, new_read_session, read_session, write_session, mark_write, \
+    delete_in_batches
+from apps.etags import page_etag
+from apps.pagination import encode_cursor, decode_cursor
+from apps.schemas import UserCreateSchema, UserLoginSchema, UserUpdateSchema, UserForgotPasswordSchema, \
+    UserPasswordResetSchema, UserBulkImportReportSchema, UserBulkImportRowSchema
 
-from sqlalchemy import select, or_
+from sqlalchemy import select, update, delete, literal, UUID, any_, bindparam, func, DateTime, case, or_, union
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string above every string that starts with ``prefix`` (code point order), if there is one."""
+    while prefix:
+        code_point = ord(prefix[-1]) + 1
+        if code_point <= 0x10FFFF:
+            # Surrogates are not encodable, and nothing sorts between them and U+E000 anyway.
+            if 0xD800 <= code_point <= 0xDFFF:
+                code_point = 0xE000
+            return prefix[:-1] + chr(code_point)
+        prefix = prefix[:-1]
+    return None
+
+
+def format_validation_error(exc: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in exc.errors())
+
+
+# The columns UserGetSchema exposes; read paths select only these and serialize rows directly.
+USER_COLUMNS = (User.id, User.username, User.fullname, User.email, User.version, User.updated_at)
+SEARCH_COLUMNS = (User.username, User.email, User.fullname)
+# Trigrams need at least three characters; shorter queries only do prefix matching.
+SEARCH_TRIGRAM_MIN_LENGTH = 3
+# No ``code``: the listing is unauthenticated, and the code alone is enough to take over the account.
+FORGOT_PASSWORD_COLUMNS = (UserForgotPassword.id, UserForgotPassword.username, UserForgotPassword.expires_at,
+                           UserForgotPassword.attempts, UserForgotPassword.user_id)
 
 
 class UserService:
     @classmethod
-    async def get_user_by_id(cls, user_id: UUID4) -> UserGetSchema:
-        async with new_session() as session:
-            query = select(User).filter(User.id == user_id)
+    async def get_user_by_id(cls, user_id: UUID4, min_version: Optional[int] = None) -> dict:
+        user = await user_cache.get_or_load(user_id, lambda: cls._load_user_by_id(user_id))
+        if min_version is not None and user['version'] < min_version:
+            # Cached before a write made on another worker; the caller has already seen the newer version.
+            await user_cache.invalidate(user_id)
+            user = await user_cache.get_or_load(user_id, lambda: cls._load_user_by_id(user_id))
+        return user
+
+    @classmethod
+    async def get_user_version(cls, user_id: UUID4, uow: Optional[UnitOfWork] = None) -> Tuple[int, datetime]:
+        async with read_session(uow, user_id) as session:
+            query = select(User.version, User.updated_at).filter(User.id == user_id)
             result = await session.execute(query)
-            user = result.scalars().first()
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail='User not found!'
-                )
-            user_schema = UserGetSchema.model_validate(user)
-            return user_schema
+            row = result.first()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='User not found!'
+            )
+        return row.version, row.updated_at
 
     @classmethod
-    async def get_users(cls) -> List[UserGetSchema]:
-        async with new_session() as session:
-            query = select(User)
+    async def _load_user_by_id(cls, user_id: UUID4) -> dict:
+        user = await user_loader.load(user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='User not found!'
+            )
+        return user
+
+    @classmethod
+    async def get_users_by_ids(cls, user_ids: List[UUID4], uow: Optional[UnitOfWork] = None) -> bytes:
+        user_ids = list(dict.fromkeys(user_ids))
+        users = await cls._load_users_by_ids(user_ids, uow)
+        return orjson.dumps({
+            'users': [users[user_id] for user_id in user_ids if user_id in users],
+            'missing': [user_id for user_id in user_ids if user_id not in users]
+        })
+
+    @classmethod
+    async def _load_users_by_ids(cls, user_ids: List[UUID4], uow: Optional[UnitOfWork] = None) -> Dict[UUID4, dict]:
+        async with read_session(uow, *user_ids) as session:
+            query = select(*USER_COLUMNS) \
+                .filter(User.id == any_(bindparam('user_ids', user_ids, type_=ARRAY(UUID))))
             result = await session.execute(query)
-            users_models = result.scalars().all()
-            user_schemas = [UserGetSchema.model_validate(user_model) for user_model in users_models]
-            return user_schemas
+            return {row.id: row._asdict() for row in result}
 
     @classmethod
-    async def create_user(cls, data: UserCreateSchema) -> None:
-        async with new_session() as session:
+    async def _get_users_page(cls, columns, limit: int, after: Optional[str], uow: Optional[UnitOfWork]) -> list:
+        async with read_session(uow) as session:
+            query = select(*columns).order_by(User.id).limit(limit + 1)
+            after_id = decode_cursor(after)
+            if after_id is not None:
+                query = query.filter(User.id > after_id)
+            result = await session.execute(query)
+            return result.all()
+
+    @classmethod
+    async def get_users(cls, limit: int, after: Optional[str] = None,
+                        uow: Optional[UnitOfWork] = None) -> Tuple[bytes, str]:
+        rows = await cls._get_users_page(USER_COLUMNS, limit, after, uow)
+        next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+        etag = page_etag(((row.id, row.version) for row in rows[:limit]), len(rows) > limit)
+        return orjson.dumps({'items': [row._asdict() for row in rows[:limit]], 'next_cursor': next_cursor}), etag
+
+    @classmethod
+    async def get_users_etag(cls, limit: int, after: Optional[str] = None, uow: Optional[UnitOfWork] = None) -> str:
+        rows = await cls._get_users_page((User.id, User.version), limit, after, uow)
+        return page_etag(((row.id, row.version) for row in rows[:limit]), len(rows) > limit)
+
+    @classmethod
+    async def search_users(cls, q: str, limit: int, offset: int = 0, uow: Optional[UnitOfWork] = None) -> bytes:
+        term = q.strip().lower()
+        if not term:
+            return orjson.dumps({'items': [], 'next_offset': None})
+        username = func.lower(User.username)
+        # A range on the text_pattern_ops index instead of LIKE 'term%', so prepared (generic) plans can use it too.
+        prefix_match = username.op('~>=~')(term)
+        upper_bound = prefix_upper_bound(term)
+        if upper_bound is not None:
+            prefix_match = prefix_match & username.op('~<~')(upper_bound)
+        # The exact match is its own candidate (an index lookup), so an unordered prefix limit cannot drop it.
+        candidates = [select(User.id).filter(username == term),
+                      select(User.id).filter(prefix_match).limit(SEARCH_CANDIDATE_LIMIT)]
+        rank = case((username == term, 2.0), (prefix_match, 1.0), else_=0.0)
+        if len(term) >= SEARCH_TRIGRAM_MIN_LENGTH:
+            substring = f'%{escape_like(term)}%'
+            fuzzy_match = or_(*(column.ilike(substring, escape='\\') for column in SEARCH_COLUMNS),
+                              *(column.op('%')(term) for column in SEARCH_COLUMNS))
+            candidates.append(select(User.id).filter(fuzzy_match).limit(SEARCH_CANDIDATE_LIMIT))
+            rank = rank + func.greatest(*(func.similarity(column, term) for column in SEARCH_COLUMNS))
+        # Rank a bounded candidate set so broad terms cannot turn into a sort over the whole table.
+        candidate_ids = union(*candidates).subquery()
+        query = select(*USER_COLUMNS).filter(User.id.in_(select(candidate_ids.c.id))) \
+            .order_by(rank.desc(), User.username).offset(offset).limit(limit + 1)
+        async with read_session(uow) as session:
+            result = await session.execute(query)
+            rows = result.all()
+        next_offset = offset + limit if len(rows) > limit else None
+        return orjson.dumps({'items': [row._asdict() for row in rows[:limit]], 'next_offset': next_offset})
+
+    @classmethod
+    async def stream_users(cls) -> AsyncIterator[bytes]:
+        async for chunk in cls.export_users('ndjson'):
+            yield chunk
+
+    @classmethod
+    async def export_users(cls, export_format: str) -> AsyncIterator[bytes]:
+        names = [column.key for column in USER_COLUMNS]
+        if export_format == 'csv':
+            yield ','.join(names).encode() + b'\r\n'
+        async with new_read_session() as session:
+            query = select(*USER_COLUMNS).execution_options(yield_per=STREAM_CHUNK_SIZE)
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                if export_format == 'csv':
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    yield buffer.getvalue().encode()
+                else:
+                    yield b''.join(orjson.dumps(dict(zip(names, row))) + b'\n' for row in rows)
+
+    @classmethod
+    async def create_user(cls, data: UserCreateSchema, uow: Optional[UnitOfWork] = None) -> None:
+        async with write_session(uow) as session:
             data_dict = data.model_dump()
-            query = select(User).filter(or_(User.username == data_dict['username'], User.email == data_dict['email']))
-            existed_user = await session.execute(query)
-            if existed_user.scalars().first():
+            password = data_dict.pop('password')
+            # Reject taken names before paying for the hash; ON CONFLICT still covers a concurrent insert.
+            taken = await session.scalar(select(User.id).filter(
+                or_(User.username == data_dict['username'], User.email == data_dict['email'])
+            ).limit(1))
+            user_id = None
+            if taken is None:
+                data_dict['hashed_password'] = await password_hasher.hash(password)
+                query = insert(User).values(**data_dict).on_conflict_do_nothing().returning(User.id)
+                result = await session.execute(query)
+                user_id = result.scalar_one_or_none()
+            if user_id is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail='Username or email is exist!'
                 )
-            password = data_dict.pop('password')
-            user = User(**data_dict)
-            user.hashed_password = user.get_password_hash(password)
-            session.add(user)
+            await add_event(session, 'user.created', {
+                'id': str(user_id), 'username': data_dict['username'], 'fullname': data_dict['fullname'],
+                'email': data_dict['email']
+            })
             await session.commit()
+            outbox_relay.wake()
+            mark_write(user_id, data_dict['username'])
+            await user_cache.invalidate(user_id)
             return None
 
     @classmethod
-    async def update_user(cls, user_id: UUID4, data: UserUpdateSchema) -> None:
+    async def bulk_create_users(cls, chunks: AsyncIterator[bytes]) -> UserBulkImportReportSchema:
+        report = UserBulkImportReportSchema()
+        batch = []
+        line_number = 0
+        async for line in iter_lines(chunks):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                batch.append((line_number, UserCreateSchema.model_validate_json(line)))
+            except ValidationError as exc:
+                report.invalid += 1
+                report.rows.append(UserBulkImportRowSchema(line=line_number, status='invalid',
+                                                           error=format_validation_error(exc)))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                await cls._bulk_insert_users(batch, report)
+                batch = []
+        if batch:
+            await cls._bulk_insert_users(batch, report)
+        report.rows.sort(key=lambda row: row.line)
+        return report
+
+    @classmethod
+    async def _bulk_insert_users(cls, batch: List[Tuple[int, UserCreateSchema]],
+                                 report: UserBulkImportReportSchema) -> None:
+        hashed_passwords = await password_hasher.hash_many([user.password for _, user in batch])
+        values = [
+            {'username': user.username, 'fullname': user.fullname, 'email': user.email,
+             'hashed_password': hashed_password}
+            for (_, user), hashed_password in zip(batch, hashed_passwords)
+        ]
         async with new_session() as session:
-            query = select(User).filter(User.id == user_id)
+            query = insert(User).values(values).on_conflict_do_nothing() \
+                .returning(User.id, User.username, User.fullname, User.email)
             result = await session.execute(query)
-            user = result.scalars().first()
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail='User not found!'
-                )
-            data_dict = data.model_dump()
-            query = select(User).filter(or_(
-                User.username == data_dict['username'], User.email == data_dict['email']
-            ), User.id != user_id)
+            created = result.all()
+            await add_events(session, 'user.created', [
+                {'id': str(row.id), 'username': row.username, 'fullname': row.fullname, 'email': row.email}
+                for row in created
+            ])
+            await session.commit()
+        outbox_relay.wake()
+        mark_write()
+        created_ids = {row.username: row.id for row in created}
+        for line_number, user in batch:
+            user_id = created_ids.pop(user.username, None)
+            if user_id is None:
+                report.conflicts += 1
+                report.rows.append(UserBulkImportRowSchema(line=line_number, status='conflict',
+                                                           error='Username or email is exist!'))
+            else:
+                report.created += 1
+                report.rows.append(UserBulkImportRowSchema(line=line_number, status='created', id=user_id))
 
-            existed_user = await session.execute(query)
-            if existed_user.scalars().first():
+    @classmethod
+    async def update_user(cls, user_id: UUID4, data: UserUpdateSchema, expected_version: Optional[int] = None,
+                          uow: Optional[UnitOfWork] = None) -> Tuple[int, datetime]:
+        async with write_session(uow) as session:
+            data_dict = data.model_dump()
+            query = update(User).filter(User.id == user_id) \
+                .values(**data_dict, version=User.version + 1, updated_at=func.now()) \
+                .returning(User.version, User.updated_at).execution_options(synchronize_session=False)
+            if expected_version is not None:
+                query = query.filter(User.version == expected_version)
+            try:
+                result = await session.execute(query)
+            except IntegrityError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail='Username or email is exist!'
                 )
-            for field, value in data_dict.items():
-                setattr(user, field, value)
-
-            session.add(user)
+            updated = result.first()
+            if updated is None:
+                exists = await session.scalar(select(User.id).filter(User.id == user_id))
+                if exists is not None:
+                    raise HTTPException(
+                        status_code=status.HTTP_412_PRECONDITION_FAILED,
+                        detail='User was modified by another request!'
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail='User not found!'
+                )
+            await add_event(session, 'user.updated', {'id': str(user_id), 'version': updated.version, **data_dict})
             await session.commit()
-            return None
+            outbox_relay.wake()
+            mark_write(user_id, data_dict['username'])
+            await user_cache.invalidate(user_id)
+            return updated.version, updated.updated_at
 
     @classmethod
-    async def delete_user(cls, user_id: UUID4) -> None:
-        async with new_session() as session:
-            query = select(User).filter(User.id == user_id)
+    async def delete_user(cls, user_id: UUID4, uow: Optional[UnitOfWork] = None) -> None:
+        async with write_session(uow) as session:
+            query = delete(User).filter(User.id == user_id).returning(User.id) \
+                .execution_options(synchronize_session=False)
             result = await session.execute(query)
-            user = result.scalars().first()
-            if not user:
+            if result.scalar_one_or_none() is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail='User not found!'
                 )
-            await session.delete(user)
+            await add_event(session, 'user.deleted', {'id': str(user_id)})
             await session.commit()
+            outbox_relay.wake()
+            mark_write(user_id)
+            await user_cache.invalidate(user_id)
             return None
 
     @classmethod
-    async def user_login(cls, data: UserLoginSchema) -> str:
-        async with new_session() as session:
-            data_dict = data.model_dump()
-            query = select(User).filter(User.username == data_dict['username'])
+    async def user_login(cls, data: UserLoginSchema, uow: Optional[UnitOfWork] = None) -> Tuple[str, str]:
+        data_dict = data.model_dump()
+        # A short session of its own rather than ``uow``, so no connection is held while the password is verified.
+        async with read_session(None, data_dict['username']) as session:
+            query = select(User.id, User.username, User.hashed_password) \
+                .filter(User.username == data_dict['username'])
             result = await session.execute(query)
-            user = result.scalars().first()
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail='User not found!'
-                )
-            user_json = jsonable_encoder(user)
-            authenticated_user = user.authenticate_user(user, data_dict['password'])
+            user = result.first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='User not found!'
+            )
+        authenticated_user, new_hash = await password_hasher.verify_and_update(
+            data_dict['password'], user.hashed_password
+        )
 
-            if not authenticated_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail='Incorrect username or password',
-                    headers={'WWW-Authenticate': 'Bearer'}
-                )
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = user.create_access_token(
-                data={'sub': user_json['username'], 'user_id': user_json['id']},
-                expires_delta=access_token_expires
+        if not authenticated_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Incorrect username or password',
+                headers={'WWW-Authenticate': 'Bearer'}
             )
-            return access_token
+        access_token = cls.create_access_token(str(user.id), user.username)
+        async with write_session(uow) as session:
+            if new_hash is not None:
+                query = update(User).filter(User.id == user.id, User.hashed_password == user.hashed_password) \
+                    .values(hashed_password=new_hash).execution_options(synchronize_session=False)
+                await session.execute(query)
+            refresh_token = await RefreshTokenService.issue(session, user.id)
+            await session.commit()
+        return access_token, refresh_token
 
     @classmethod
-    async def user_forgot_password(cls, data: UserForgotPasswordSchema) -> int:
-        async with new_session() as session:
+    def create_access_token(cls, user_id: str, username: str) -> str:
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        return User.create_access_token(
+            data={'sub': username, 'user_id': user_id},
+            expires_delta=access_token_expires
+        )
+
+    @classmethod
+    async def user_forgot_password(cls, data: UserForgotPasswordSchema,
+                                   uow: Optional[UnitOfWork] = None) -> Optional[int]:
+        """Issue a reset code; it is mailed by the worker, or returned when no SMTP host is configured."""
+        async with write_session(uow) as session:
             data_dict = data.model_dump()
-            query = select(User).filter(User.username == data_dict['username'])
+            generated_code = random.randint(1000, 10000)
+            expires_at = datetime.now(timezone.utc) + timedelta(minutes=FORGOT_PASSWORD_CODE_EXPIRE_MINUTES)
+            user_query = select(
+                literal(uuid.uuid4(), UUID(as_uuid=True)), User.username, literal(generated_code),
+                literal(expires_at, DateTime(timezone=True)), User.id
+            ).filter(User.username == data_dict['username'])
+            query = insert(UserForgotPassword).from_select(
+                ['id', 'username', 'code', 'expires_at', 'user_id'], user_query
+            )
+            query = query.on_conflict_do_update(
+                index_elements=[UserForgotPassword.user_id],
+                set_={'username': query.excluded.username, 'code': query.excluded.code,
+                      'expires_at': query.excluded.expires_at, 'attempts': 0}
+            ).returning(UserForgotPassword.user_id, UserForgotPassword.username)
             result = await session.execute(query)
-            user = result.scalars().first()
-            if not user:
+            forgot_password = result.one_or_none()
+            if forgot_password is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail='User not found!'
                 )
-            generated_code = random.randint(1000, 10000)
-            f_pw_query = select(UserForgotPassword).filter(UserForgotPassword.user_id == user.id)
-            result = await session.execute(f_pw_query)
-            forgot_pw = result.scalars().first()
-            if forgot_pw:
-                forgot_pw.code = generated_code
-            else:
-                forgot_pw = UserForgotPassword(username=data_dict['username'], code=generated_code, user_id=user.id)
-            session.add(forgot_pw)
+            event = {'user_id': str(forgot_password.user_id), 'username': forgot_password.username,
+                     'expires_at': expires_at.isoformat()}
+            if RESET_CODE_EMAIL_ENABLED:
+                email = await session.scalar(select(User.email).filter(User.id == forgot_password.user_id))
+                event.update(email=email, code=generated_code)
+            await add_event(session, 'user.password_reset_requested', event)
             await session.commit()
-            return generated_code
+            outbox_relay.wake()
+            mark_write()
+            return None if RESET_CODE_EMAIL_ENABLED else generated_code
 
     @classmethod
-    async def password_reset(cls, data: UserPasswordResetSchema) -> None:
-        async with new_session() as session:
+    async def password_reset(cls, data: UserPasswordResetSchema, uow: Optional[UnitOfWork] = None) -> None:
+        async with write_session(uow) as session:
             data_dict = data.model_dump()
-            query = select(UserForgotPassword).filter(UserForgotPassword.username == data_dict['username'],
-                                                      UserForgotPassword.code == data_dict['code'])
-            result = await session.execute(query)
-            user_f_pw = result.scalars().first()
-            if not user_f_pw:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail='User not found!'
-                )
             if data_dict['password'] != data_dict['repeated_password']:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail='Passwords is not similar!'
                 )
-            user_query = select(User).filter(User.id == user_f_pw.user_id)
-            result = await session.execute(user_query)
-            user = result.scalars().first()
-            user.hashed_password = user.get_password_hash(data_dict['password'])
-            session.add(user)
+            # The code is consumed before hashing, so junk codes cost no hash. The row lock held until commit
+            # makes a code usable only once, and a failed hash rolls the code back.
+            consumed = delete(UserForgotPassword).filter(
+                UserForgotPassword.username == data_dict['username'],
+                UserForgotPassword.code == data_dict['code'],
+                UserForgotPassword.expires_at > func.now(),
+                UserForgotPassword.attempts < FORGOT_PASSWORD_MAX_ATTEMPTS
+            ).returning(UserForgotPassword.user_id).execution_options(synchronize_session=False)
+            result = await session.execute(consumed)
+            user_id = result.scalar_one_or_none()
+            if user_id is None:
+                await session.execute(
+                    update(UserForgotPassword).filter(
+                        UserForgotPassword.username == data_dict['username'],
+                        UserForgotPassword.expires_at > func.now()
+                    ).values(attempts=UserForgotPassword.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail='Invalid or expired code!'
+                )
+            hashed_password = await password_hasher.hash(data_dict['password'])
+            await session.execute(
+                update(User).filter(User.id == user_id).values(hashed_password=hashed_password)
+                .execution_options(synchronize_session=False)
+            )
+            await RefreshTokenService.revoke_user(session, user_id)
             await session.commit()
+            mark_write(user_id, data_dict['username'])
             return None
 
 
+class RefreshTokenService:
+    @classmethod
+    def hash_token(cls, token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    async def issue(cls, session: AsyncSession, user_id: UUID4) -> str:
+        token = secrets.token_urlsafe(32)
+        query = insert(RefreshToken).values(
+            token_hash=cls.hash_token(token),
+            user_id=user_id,
+            expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        )
+        await session.execute(query)
+        return token
+
+    @classmethod
+    async def refresh(cls, token: str, uow: Optional[UnitOfWork] = None) -> Tuple[str, str]:
+        async with write_session(uow) as session:
+            query = delete(RefreshToken.__table__).where(
+                RefreshToken.token_hash == cls.hash_token(token),
+                RefreshToken.expires_at > func.now(),
+                RefreshToken.user_id == User.id
+            ).returning(User.id, User.username)
+            result = await session.execute(query)
+            row = result.first()
+            if row is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail='Invalid refresh token',
+                    headers={'WWW-Authenticate': 'Bearer'}
+                )
+            user_id, username = row
+            refresh_token = await cls.issue(session, user_id)
+            await session.commit()
+        return UserService.create_access_token(str(user_id), username), refresh_token
+
+    @classmethod
+    async def revoke(cls, token: str, uow: Optional[UnitOfWork] = None) -> None:
+        async with write_session(uow) as session:
+            query = delete(RefreshToken).filter(RefreshToken.token_hash == cls.hash_token(token)) \
+                .execution_options(synchronize_session=False)
+            await session.execute(query)
+            await session.commit()
+        return None
+
+    @classmethod
+    async def revoke_user(cls, session: AsyncSession, user_id: UUID4) -> None:
+        query = delete(RefreshToken).filter(RefreshToken.user_id == user_id) \
+            .execution_options(synchronize_session=False)
+        await session.execute(query)
+        return None
+
+    @classmethod
+    async def prune_expired(cls) -> int:
+        return await delete_in_batches(RefreshToken, RefreshToken.expires_at <= func.now(),
+                                       REFRESH_TOKEN_PRUNE_BATCH_SIZE)
+
+
+user_loader = BatchCoalescer(UserService._load_users_by_ids, max_batch_size=USER_BATCH_MAX_IDS,
+                             max_delay=USER_BATCH_COALESCE_DELAY_MS / 1000)
+
+
 class UserForgotPWService:
     @classmethod
-    async def user_forgot_pw_get_all(cls) -> List[UserForgotPWSGetSchema]:
-        async with new_session() as session:
-            query = select(UserForgotPassword)
+    async def user_forgot_pw_get_all(cls, limit: int, after: Optional[str] = None,
+                                     uow: Optional[UnitOfWork] = None) -> bytes:
+        async with read_session(uow) as session:
+            query = select(*FORGOT_PASSWORD_COLUMNS).order_by(UserForgotPassword.id).limit(limit + 1)
+            after_id = decode_cursor(after)
+            if after_id is not None:
+                query = query.filter(UserForgotPassword.id > after_id)
             result = await session.execute(query)
-            users_forgotten = result.scalars().all()
-            users_forgotten_schemes = [
-                UserForgotPWSGetSchema.model_validate(user_forgot) for user_forgot in users_forgotten
-            ]
-            return users_forgotten_schemes
+            rows = result.all()
+        next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+        return orjson.dumps({'items': [row._asdict() for row in rows[:limit]], 'next_cursor': next_cursor})
+
+    @classmethod
+    async def stream_user_forgot_pw(cls) -> AsyncIterator[bytes]:
+        async with new_read_session() as session:
+            query = select(*FORGOT_PASSWORD_COLUMNS).order_by(UserForgotPassword.id) \
+                .execution_options(yield_per=STREAM_CHUNK_SIZE)
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                yield b''.join(orjson.dumps(row._asdict()) + b'\n' for row in rows)
+
+    @classmethod
+    async def prune_expired(cls) -> int:
+        return await delete_in_batches(UserForgotPassword, UserForgotPassword.expires_at <= func.now(),
+                                       FORGOT_PASSWORD_PRUNE_BATCH_SIZE)
@@ -0,0 +1,110 @@
+import abc
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+from fastapi import HTTPException, Request, status
+
+from apps.config import LOGIN_RATE_LIMIT_ATTEMPTS, LOGIN_RATE_LIMIT_IP_ATTEMPTS, LOGIN_RATE_LIMIT_WINDOW_SECONDS, \
+    LOGIN_LOCKOUT_THRESHOLD, LOGIN_LOCKOUT_BASE_SECONDS, LOGIN_LOCKOUT_MAX_SECONDS, LOGIN_THROTTLE_MAX_KEYS, \
+    TRUST_PROXY_HEADERS
+
+
+class RateLimiterBackend(abc.ABC):
+    @abc.abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        """Record an attempt; return seconds to wait if over the limit or locked out, else 0."""
+
+    @abc.abstractmethod
+    async def add_failure(self, key: str, threshold: int, base: float, cap: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def reset(self, key: str) -> None:
+        ...
+
+
+class _Entry:
+    __slots__ = ('attempts', 'failures', 'locked_until')
+
+    def __init__(self, limit: int):
+        self.attempts: Deque[float] = deque(maxlen=limit)
+        self.failures = 0
+        self.locked_until = 0.0
+
+
+class InMemoryRateLimiterBackend(RateLimiterBackend):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def _entry(self, key: str, limit: int) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(limit)
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.monotonic()
+        entry = self._entry(key, limit)
+        if entry.locked_until > now:
+            return entry.locked_until - now
+        if len(entry.attempts) >= limit and now - entry.attempts[0] < window:
+            return window - (now - entry.attempts[0])
+        entry.attempts.append(now)
+        return 0
+
+    async def add_failure(self, key: str, threshold: int, base: float, cap: float) -> None:
+        entry = self._entry(key, LOGIN_RATE_LIMIT_ATTEMPTS)
+        entry.failures += 1
+        if entry.failures >= threshold:
+            delay = min(cap, base * 2 ** (entry.failures - threshold))
+            entry.locked_until = time.monotonic() + delay
+
+    async def reset(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class LoginThrottle:
+    def __init__(self, backend: RateLimiterBackend):
+        self.backend = backend
+
+    async def check(self, username: str, client_ip: Optional[str]) -> None:
+        retry_after = await self.backend.hit(f'user:{username}', LOGIN_RATE_LIMIT_ATTEMPTS,
+                                             LOGIN_RATE_LIMIT_WINDOW_SECONDS)
+        if not retry_after and client_ip:
+            retry_after = await self.backend.hit(f'ip:{client_ip}', LOGIN_RATE_LIMIT_IP_ATTEMPTS,
+                                                 LOGIN_RATE_LIMIT_WINDOW_SECONDS)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='Too many login attempts, try again later',
+                headers={'Retry-After': str(math.ceil(retry_after))}
+            )
+
+    async def failure(self, username: str) -> None:
+        await self.backend.add_failure(f'user:{username}', LOGIN_LOCKOUT_THRESHOLD, LOGIN_LOCKOUT_BASE_SECONDS,
+                                       LOGIN_LOCKOUT_MAX_SECONDS)
+
+    async def success(self, username: str) -> None:
+        await self.backend.reset(f'user:{username}')
+
+
+def get_client_ip(request: Request) -> Optional[str]:
+    if TRUST_PROXY_HEADERS:
+        real_ip = request.headers.get('x-real-ip')
+        if real_ip:
+            return real_ip.strip()
+        forwarded_for = request.headers.get('x-forwarded-for')
+        if forwarded_for:
+            # nginx appends the peer address, so the last entry is the one it saw.
+            return forwarded_for.rsplit(',', 1)[-1].strip()
+    return request.client.host if request.client else None
+
+
+login_throttle = LoginThrottle(InMemoryRateLimiterBackend(max_keys=LOGIN_THROTTLE_MAX_KEYS))
@@ -0,0 +1,96 @@
+"""Cold-start time and first-request latency of the server process.
+
+Starts the service as a subprocess, polls until it answers, then times the
+first and the following requests to each ``--request``. Two entry points are
+compared:
+
+* ``baseline``: ``uvicorn main:app`` on the asyncio loop and h11, without
+  warm-up (how the Dockerfile used to start the service).
+* ``server``: ``python -m server`` (uvloop, httptools) with WARMUP_ENABLED.
+
+Startup is measured to the first successful response, so it includes the
+lifespan warm-up. Point DATABASE_URL and RABBITMQ_URL at live services for
+the warm-up and first-request numbers to mean anything; unreachable ones
+only show up as warm-up warnings in the server log.
+
+    python -m benchmarks.bench_cold_start --request "GET /users?limit=10" \\
+        --request "POST /users/login?username=u&password=p"
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import httpx
+
+COMMANDS = {
+    'baseline': ['-m', 'uvicorn', 'main:app', '--loop', 'asyncio', '--http', 'h11'],
+    'server': ['-m', 'server'],
+}
+
+
+def start(mode: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, SERVER_HOST='127.0.0.1', SERVER_PORT=str(port), SERVER_WORKERS=str(workers),
+               WARMUP_ENABLED='true' if mode == 'server' else 'false')
+    args = [sys.executable, *COMMANDS[mode]]
+    if mode == 'baseline':
+        args += ['--host', '127.0.0.1', '--port', str(port)]
+    return subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(client: httpx.Client, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            client.get('/metrics')
+            return
+        except httpx.TransportError:
+            time.sleep(0.005)
+    raise TimeoutError('server did not start')
+
+
+def timed(client: httpx.Client, request: str) -> float:
+    method, _, path = request.partition(' ')
+    start = time.perf_counter()
+    client.request(method, path)
+    return time.perf_counter() - start
+
+
+def measure(mode: str, port: int, workers: int, requests: List[str], repeat: int) -> dict:
+    started = time.perf_counter()
+    process = start(mode, port, workers)
+    try:
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=30) as client:
+            wait_ready(client, timeout=60)
+            result = {'mode': mode, 'startup_ms': round((time.perf_counter() - started) * 1000, 1)}
+            for request in requests:
+                first = timed(client, request)
+                rest = [timed(client, request) for _ in range(repeat)]
+                result[request] = {'first_ms': round(first * 1000, 2),
+                                   'steady_p50_ms': round(statistics.median(rest) * 1000, 2)}
+            return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(COMMANDS), default=list(COMMANDS))
+    parser.add_argument('--request', action='append', dest='requests', help='"METHOD /path", repeatable')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=20, help='steady-state requests after the first one')
+    parser.add_argument('--runs', type=int, default=3, help='process starts per mode')
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        for _ in range(args.runs):
+            print(measure(mode, args.port, args.workers, args.requests or ['GET /metrics'], args.repeat))
+
+
+if __name__ == '__main__':
+    main()
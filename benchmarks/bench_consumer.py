@@ -0,0 +1,101 @@
+"""Consumer throughput against an in-process RabbitMQ stand-in.
+
+The stand-in pushes deliveries while the consumer has fewer than
+``prefetch`` unacked messages and charges a fixed round-trip time for each
+ack, so the numbers show what prefetch, handler concurrency and batched acks
+buy when handlers wait on I/O (``--work-ms``). It does not model broker CPU
+or network bandwidth.
+
+    python -m benchmarks.bench_consumer --messages 5000 --work-ms 5 --rtt-ms 1
+"""
+import argparse
+import asyncio
+import time
+
+from apps.consumer import AckBatcher, RabbitConsumer
+
+CONFIGS = [
+    # name, prefetch, concurrency, ack batch size
+    ('one_at_a_time', 1, 1, 1),
+    ('prefetch_ack_each', 100, 20, 1),
+    ('prefetch_ack_batched', 100, 20, 50),
+]
+
+
+class FakeMessage:
+    def __init__(self, broker: 'FakeBroker', delivery_tag: int):
+        self.broker = broker
+        self.delivery_tag = delivery_tag
+        self.body = b'{"event": "bench", "payload": {}}'
+        self.headers = {}
+
+    async def ack(self, multiple: bool = False) -> None:
+        await asyncio.sleep(self.broker.rtt)
+        self.broker.settle(self.delivery_tag, multiple)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True) -> None:
+        await asyncio.sleep(self.broker.rtt)
+        self.broker.settle(self.delivery_tag, multiple)
+
+
+class FakeBroker:
+    def __init__(self, rtt: float, prefetch: int, messages: int):
+        self.rtt = rtt
+        self.prefetch = prefetch
+        self.messages = messages
+        self.unacked: set = set()
+        self.acked = 0
+        self.acks_sent = 0
+        self.changed = asyncio.Event()
+
+    def settle(self, delivery_tag: int, multiple: bool) -> None:
+        settled = {tag for tag in self.unacked if tag <= delivery_tag} if multiple else {delivery_tag}
+        self.unacked -= settled
+        self.acked += len(settled)
+        self.acks_sent += 1
+        self.changed.set()
+
+    async def deliver(self, consumer: RabbitConsumer) -> None:
+        for delivery_tag in range(1, self.messages + 1):
+            while len(self.unacked) >= self.prefetch:
+                self.changed.clear()
+                await self.changed.wait()
+            self.unacked.add(delivery_tag)
+            await consumer.on_message(FakeMessage(self, delivery_tag))
+        await consumer.drain()
+
+
+async def run(name: str, prefetch: int, concurrency: int, ack_batch: int, messages: int, work: float,
+              rtt: float) -> dict:
+    async def handler(message):
+        await asyncio.sleep(work)
+
+    broker = FakeBroker(rtt, prefetch, messages)
+    consumer = RabbitConsumer(handler, prefetch=prefetch, concurrency=concurrency, retry_delays=[],
+                              acks=AckBatcher(batch_size=ack_batch, delay=0.01))
+    start = time.perf_counter()
+    await broker.deliver(consumer)
+    elapsed = time.perf_counter() - start
+    assert broker.acked == messages, (broker.acked, messages)
+    return {
+        'config': name,
+        'messages_per_second': round(messages / elapsed, 1),
+        'ack_frames': broker.acks_sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--work-ms', type=float, default=5)
+    parser.add_argument('--rtt-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    for name, prefetch, concurrency, ack_batch in CONFIGS:
+        messages = args.messages if prefetch > 1 else min(args.messages, 500)
+        print(asyncio.run(run(name, prefetch, concurrency, ack_batch, messages, args.work_ms / 1000,
+                              args.rtt_ms / 1000)))
+
+
+if __name__ == '__main__':
+    main()
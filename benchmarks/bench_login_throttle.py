@@ -0,0 +1,57 @@
+"""Cost of rejecting throttled logins.
+
+Locks a username out, then hammers ``POST /users/login`` on the real app
+through an in-process ASGI transport. Every request is rejected with 429
+before any database or bcrypt work, so no database is needed.
+
+    python -m benchmarks.bench_login_throttle --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from apps.throttling import login_throttle
+from main import app
+
+
+async def run(requests: int, concurrency: int) -> dict:
+    for _ in range(100):
+        await login_throttle.failure('victim')
+
+    latencies = []
+    statuses = set()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def worker(count):
+            for _ in range(count):
+                start = time.perf_counter()
+                response = await client.post('/users/login', params={'username': 'victim', 'password': 'guess'})
+                latencies.append(time.perf_counter() - start)
+                statuses.add(response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'statuses': sorted(statuses),
+        'rejections_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    print(asyncio.run(run(args.requests, args.concurrency)))
+
+
+if __name__ == '__main__':
+    main()
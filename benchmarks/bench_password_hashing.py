@@ -0,0 +1,100 @@
+"""Login throughput and latency of a cheap endpoint during a login burst.
+
+Compares verifying bcrypt hashes inline on the event loop (the old behaviour)
+with the worker-pool backed ``PasswordHasher``. No database is needed: the
+login route only does the password verification.
+
+    python -m benchmarks.bench_password_hashing --logins 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from apps.hashing import PasswordHasher
+from apps.models import User
+
+
+def build_app(mode: str, hashed_password: str, hasher: PasswordHasher) -> FastAPI:
+    app = FastAPI()
+
+    @app.post('/login')
+    async def login():
+        if mode == 'inline':
+            ok = User.verify_password('secret', hashed_password)
+        else:
+            ok = await hasher.verify('secret', hashed_password)
+        return {'ok': ok}
+
+    @app.get('/ping')
+    async def ping():
+        return {'ok': True}
+
+    return app
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(mode: str, logins: int, concurrency: int, executor: str, workers: int) -> dict:
+    hashed_password = User.get_password_hash('secret')
+    hasher = PasswordHasher(executor=executor, workers=workers, max_pending=logins)
+    transport = httpx.ASGITransport(app=build_app(mode, hashed_password, hasher))
+    ping_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await client.post('/login')
+
+        async def login_worker(count):
+            for _ in range(count):
+                await client.post('/login')
+
+        async def ping_worker():
+            # Latency is measured from when the ping was due, so time spent
+            # waiting for a blocked event loop is counted.
+            while not done.is_set():
+                due = time.perf_counter() + 0.005
+                await asyncio.sleep(0.005)
+                await client.get('/ping')
+                ping_latencies.append(time.perf_counter() - due)
+
+        pinger = asyncio.create_task(ping_worker())
+        start = time.perf_counter()
+        per_worker = logins // concurrency
+        await asyncio.gather(*(login_worker(per_worker) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await pinger
+
+    hasher.shutdown()
+    return {
+        'mode': mode,
+        'logins_per_second': round(per_worker * concurrency / elapsed, 1),
+        'pings_served': len(ping_latencies),
+        'ping_p50_ms': round(statistics.median(ping_latencies) * 1000, 2),
+        'ping_p99_ms': round(percentile(ping_latencies, 99) * 1000, 2),
+        'ping_max_ms': round(max(ping_latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=128)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    for mode in ('inline', 'pool'):
+        result = asyncio.run(run(mode, args.logins, args.concurrency, args.executor, args.workers))
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
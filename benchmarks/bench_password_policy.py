@@ -0,0 +1,72 @@
+"""Hash throughput and verify latency for candidate password-hash settings.
+
+Run it on the deployment hardware to pick PASSWORD_HASH_SCHEMES and the
+matching cost settings:
+
+    python -m benchmarks.bench_password_policy bcrypt:10 bcrypt:12 argon2:2,19456,1
+
+A candidate is ``bcrypt:<rounds>`` or ``argon2:<time_cost>,<memory_kib>,<parallelism>``.
+Without arguments the currently configured policy is measured.
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from apps.config import PASSWORD_HASH_SCHEMES, BCRYPT_ROUNDS, ARGON2_TIME_COST, ARGON2_MEMORY_COST, \
+    ARGON2_PARALLELISM
+from apps.models import build_password_context
+
+
+def parse_candidate(candidate: str):
+    scheme, _, settings = candidate.partition(':')
+    if scheme == 'bcrypt':
+        return build_password_context(['bcrypt'], bcrypt_rounds=int(settings or BCRYPT_ROUNDS))
+    if scheme == 'argon2':
+        time_cost, memory_cost, parallelism = (settings.split(',') if settings else
+                                               (ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM))
+        return build_password_context(['argon2'], argon2_time_cost=int(time_cost),
+                                      argon2_memory_cost=int(memory_cost), argon2_parallelism=int(parallelism))
+    raise argparse.ArgumentTypeError(f'Unknown scheme in candidate {candidate!r}')
+
+
+def measure(candidate: str, duration: float, verifies: int) -> dict:
+    context = parse_candidate(candidate)
+    hashes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        hashed_password = context.hash('correct horse battery staple')
+        hashes += 1
+    hashes_per_second = hashes / (time.perf_counter() - start)
+
+    verify_times: List[float] = []
+    for _ in range(verifies):
+        start = time.perf_counter()
+        context.verify('correct horse battery staple', hashed_password)
+        verify_times.append(time.perf_counter() - start)
+    verify_times.sort()
+    return {
+        'candidate': candidate,
+        'hashes_per_second': round(hashes_per_second, 2),
+        'verify_p50_ms': round(statistics.median(verify_times) * 1000, 2),
+        'verify_p99_ms': round(verify_times[min(len(verify_times) - 1, int(len(verify_times) * 0.99))] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('candidates', nargs='*')
+    parser.add_argument('--duration', type=float, default=3, help='seconds spent hashing per candidate')
+    parser.add_argument('--verifies', type=int, default=20)
+    args = parser.parse_args()
+
+    candidates = args.candidates or [
+        f'{PASSWORD_HASH_SCHEMES[0]}:{BCRYPT_ROUNDS}' if PASSWORD_HASH_SCHEMES[0] == 'bcrypt'
+        else PASSWORD_HASH_SCHEMES[0]
+    ]
+    for candidate in candidates:
+        print(measure(candidate, args.duration, args.verifies))
+
+
+if __name__ == '__main__':
+    main()
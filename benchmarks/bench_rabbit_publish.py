@@ -0,0 +1,131 @@
+"""Publish throughput against an in-process RabbitMQ stand-in.
+
+The stand-in charges a fixed round-trip time for every AMQP operation that
+needs one (connect, channel open, queue declare, publish confirm, close), so
+the numbers show how many round trips each publishing strategy pays. It does
+not model the broker-side cost of opening connections, so connect-per-message
+looks better here than it does against a real broker.
+
+    python -m benchmarks.bench_rabbit_publish --messages 5000 --rtt-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+import aio_pika
+
+from apps.config import QUEUE_NAME
+from apps.rabbit import Rabbit
+
+
+class FakeExchange:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.published = 0
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(self.rtt)
+        self.published += 1
+
+
+class FakeChannel:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.is_closed = False
+        self.default_exchange = FakeExchange(rtt)
+
+    def __await__(self):
+        yield from asyncio.sleep(self.rtt).__await__()
+        return self
+
+    async def __aenter__(self):
+        return await self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def declare_queue(self, name, durable=False):
+        await asyncio.sleep(self.rtt)
+
+    async def close(self):
+        await asyncio.sleep(self.rtt)
+        self.is_closed = True
+
+
+class FakeConnection:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.is_closed = False
+
+    def channel(self, publisher_confirms=True):
+        return FakeChannel(self.rtt)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await asyncio.sleep(self.rtt)
+        self.is_closed = True
+
+
+async def connect_per_message(rtt: float, messages: int, concurrency: int) -> None:
+    async def send():
+        await asyncio.sleep(rtt * 3)
+        connection = FakeConnection(rtt)
+        async with connection:
+            async with connection.channel() as channel:
+                await channel.declare_queue(QUEUE_NAME, durable=True)
+                await channel.default_exchange.publish(aio_pika.Message(body=b'x'), routing_key=QUEUE_NAME)
+
+    await run_concurrently(send, messages, concurrency)
+
+
+async def pooled(rtt: float, messages: int, concurrency: int) -> None:
+    await run_concurrently(lambda: Rabbit.publish(b'x'), messages, concurrency)
+
+
+async def batched(rtt: float, messages: int, concurrency: int) -> None:
+    await run_concurrently(lambda: Rabbit.batch_publisher.publish(b'x'), messages, concurrency)
+
+
+async def run_concurrently(send, messages: int, concurrency: int) -> None:
+    async def worker(count):
+        for _ in range(count):
+            await send()
+
+    await asyncio.gather(*(worker(messages // concurrency) for _ in range(concurrency)))
+
+
+async def run(strategy, rtt: float, messages: int, concurrency: int) -> dict:
+    async def get_rabbit_connection():
+        await asyncio.sleep(rtt * 3)
+        return FakeConnection(rtt)
+
+    Rabbit.get_rabbit_connection = get_rabbit_connection
+    await Rabbit.connect()
+    start = time.perf_counter()
+    await strategy(rtt, messages, concurrency)
+    elapsed = time.perf_counter() - start
+    await Rabbit.close()
+    return {
+        'strategy': strategy.__name__,
+        'messages_per_second': round(messages // concurrency * concurrency / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    for strategy in (connect_per_message, pooled, batched):
+        print(asyncio.run(run(strategy, args.rtt_ms / 1000, args.messages, args.concurrency)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Pool checkouts per request and throughput with a saturated pool.
+
+Each simulated request runs the reads behind a conditional list fetch and a
+user lookup (``get_users_etag``, ``get_users``, ``get_user_version``). The
+``per_call`` mode opens a session for every service call, as the routes did
+before. The ``unit_of_work`` mode shares one read-only UnitOfWork per
+request, as the routes do now. Keep ``--concurrency`` above
+DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW so the pool stays saturated.
+Throughput is then bounded by how long and how often each request holds a
+connection.
+
+Runs against DATABASE_URL with METRICS_ENABLED (the default). The users
+table must already hold at least ``--limit`` rows.
+
+    DATABASE_POOL_SIZE=5 DATABASE_MAX_OVERFLOW=0 python -m benchmarks.bench_request_sessions --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Optional
+
+from sqlalchemy import select
+
+from apps.database import UnitOfWork, new_session, dispose_engines
+from apps.metrics import RequestStats, request_stats
+from apps.models import User
+from apps.services import UserService
+
+
+async def simulated_request(mode: str, user_id, limit: int) -> int:
+    stats = RequestStats()
+    request_stats.set(stats)
+    uow: Optional[UnitOfWork] = UnitOfWork(read_only=True) if mode == 'unit_of_work' else None
+    try:
+        await UserService.get_users_etag(limit, None, uow)
+        await UserService.get_users(limit, None, uow)
+        await UserService.get_user_version(user_id, uow)
+    finally:
+        if uow is not None:
+            await uow.release()
+    return stats.checkouts
+
+
+async def run(mode: str, requests: int, concurrency: int, limit: int) -> dict:
+    async with new_session() as session:
+        user_id = await session.scalar(select(User.id).limit(1))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await simulated_request(mode, user_id, limit)
+
+    start = time.perf_counter()
+    checkouts = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'requests_per_second': round(requests / elapsed, 1),
+        'checkouts_per_request': statistics.mean(checkouts),
+    }
+
+
+async def main_async(args) -> None:
+    for mode in args.modes:
+        await run(mode, min(args.requests, 100), args.concurrency, args.limit)  # warm-up
+        print(await run(mode, args.requests, args.concurrency, args.limit))
+    await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['per_call', 'unit_of_work'],
+                        default=['per_call', 'unit_of_work'])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20, help='page size of the list reads')
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
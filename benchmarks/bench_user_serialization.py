@@ -0,0 +1,85 @@
+"""Per-row CPU cost of the user list read path: ORM + pydantic vs column projection + orjson.
+
+Rows come from an in-memory SQLite copy of the users table, so the numbers
+cover row fetching, ORM hydration and serialization but not network or
+Postgres time. The ``orm`` path mirrors what GET /users did before: load
+``User`` entities, build ``UserGetSchema``/``UserPageSchema``, then the
+response_model round trip (dump, re-validate, jsonable_encoder, json.dumps).
+The ``columns`` path is the current one: select the exposed columns and
+dump rows straight to bytes with orjson.
+
+    python -m benchmarks.bench_user_serialization --rows 10000 50000
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from apps.models import User
+from apps.schemas import UserGetSchema, UserPageSchema
+from apps.services import USER_COLUMNS
+
+
+def seed(rows: int):
+    engine = create_engine('sqlite://')
+    User.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {'id': uuid.uuid4(), 'username': f'user_{i}', 'fullname': f'User {i}', 'email': f'user_{i}@example.com',
+             'hashed_password': '$2b$12$' + 'x' * 53}
+            for i in range(rows)
+        ])
+    return engine
+
+
+def orm_path(engine) -> bytes:
+    with Session(engine) as session:
+        users = session.execute(select(User).order_by(User.id)).scalars().all()
+        page = UserPageSchema(items=[UserGetSchema.model_validate(user) for user in users], next_cursor=None)
+    validated = UserPageSchema.model_validate(page.model_dump())
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def columns_path(engine) -> bytes:
+    with Session(engine) as session:
+        rows = session.execute(select(*USER_COLUMNS).order_by(User.id)).all()
+    return orjson.dumps({'items': [row._asdict() for row in rows], 'next_cursor': None})
+
+
+def measure(func, engine, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(engine)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        engine = seed(rows)
+        orm = measure(orm_path, engine, args.repeat)
+        columns = measure(columns_path, engine, args.repeat)
+        print({
+            'rows': rows,
+            'orm_ms': round(orm * 1000, 1),
+            'columns_ms': round(columns * 1000, 1),
+            'orm_us_per_row': round(orm / rows * 1e6, 2),
+            'columns_us_per_row': round(columns / rows * 1e6, 2),
+            'speedup': round(orm / columns, 2),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Diff two harness result files.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms']
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    print(f"{before['commit']} -> {after['commit']}")
+    for route in sorted(set(before['routes']) & set(after['routes'])):
+        print(route)
+        for metric in METRICS:
+            old, new = before['routes'][route][metric], after['routes'][route][metric]
+            print(f'  {metric:<15}{old:>12}{new:>12}{change(old, new):>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Load-test harness for the auth service routes.
+
+Drives the FastAPI ``app`` in-process through an ASGI transport (default), or
+a running server with ``--base-url``. Reports throughput and p50/p95/p99
+latency per route and writes the results as JSON, so runs from different
+commits can be compared with ``benchmarks/compare.py``.
+
+The database is whatever DATABASE_URL points at; it has to be PostgreSQL,
+since the write paths use Postgres-only upserts. Unless ``--skip-seed`` is
+given, the tables are created and ``--users`` rows are inserted directly,
+sharing one precomputed hash so seeding does not pay bcrypt per row.
+In-process runs replace the RabbitMQ publisher with a no-op, so no broker is
+needed.
+
+    python -m benchmarks.harness --users 10000 --requests 2000 --concurrency 32 --output bench.json
+    python -m benchmarks.harness --base-url http://localhost --skip-seed --output bench.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Callable, Dict, List
+
+# In-process runs share one client address; keep the login throttle out of the measurement.
+os.environ.setdefault('LOGIN_RATE_LIMIT_ATTEMPTS', '1000000000')
+os.environ.setdefault('LOGIN_RATE_LIMIT_IP_ATTEMPTS', '1000000000')
+
+import httpx  # noqa: E402
+from sqlalchemy.dialects.postgresql import insert  # noqa: E402
+
+from apps.database import new_session, create_tables  # noqa: E402
+from apps.models import User  # noqa: E402
+from apps.rabbit import Rabbit  # noqa: E402
+
+PASSWORD = 'bench-password'
+ROUTES = ['/users', '/users/{id}', '/users/login', '/users/forgot_password', '/users/send_message']
+
+
+async def seed_users(count: int, batch_size: int = 1000) -> None:
+    await create_tables()
+    hashed_password = User.get_password_hash(PASSWORD)
+    for start in range(0, count, batch_size):
+        values = [
+            {'username': f'bench_{i}', 'fullname': f'Bench User {i}', 'email': f'bench_{i}@example.com',
+             'hashed_password': hashed_password}
+            for i in range(start, min(count, start + batch_size))
+        ]
+        async with new_session() as session:
+            await session.execute(insert(User).values(values).on_conflict_do_nothing())
+            await session.commit()
+
+
+async def fake_publish_many(bodies, routing_key=None):
+    return [None] * len(bodies)
+
+
+async def collect_user_ids(client: httpx.AsyncClient, limit: int) -> List[str]:
+    ids: List[str] = []
+    after = None
+    while len(ids) < limit:
+        params = {'limit': min(1000, limit - len(ids))}
+        if after:
+            params['after'] = after
+        page = (await client.get('/users', params=params)).raise_for_status().json()
+        ids.extend(user['id'] for user in page['items'])
+        after = page['next_cursor']
+        if not after:
+            break
+    return ids
+
+
+def build_requests(user_ids: List[str], users: int) -> Dict[str, Callable]:
+    ids = itertools.cycle(user_ids)
+    usernames = itertools.cycle(f'bench_{i}' for i in range(users))
+    return {
+        '/users': lambda client: client.get('/users'),
+        '/users/{id}': lambda client: client.get(f'/users/{next(ids)}'),
+        '/users/login': lambda client: client.post(
+            '/users/login', params={'username': next(usernames), 'password': PASSWORD}
+        ),
+        '/users/forgot_password': lambda client: client.post(
+            '/users/forgot_password', params={'username': next(usernames)}
+        ),
+        '/users/send_message': lambda client: client.post('/users/send_message', params={'text': 'bench'}),
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+async def run_route(client: httpx.AsyncClient, make_request: Callable, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while next(remaining) < requests:
+            start = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(args) -> dict:
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        from main import app
+
+        Rabbit.publish_many = fake_publish_many
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench', timeout=60)
+
+    if not args.skip_seed:
+        await seed_users(args.users)
+
+    results = {}
+    async with client:
+        user_ids = await collect_user_ids(client, args.users)
+        requests = build_requests(user_ids, args.users)
+        for route in args.routes:
+            await run_route(client, requests[route], args.warmup, args.concurrency)
+            results[route] = await run_route(client, requests[route], args.requests, args.concurrency)
+            print(route, results[route])
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'target': args.base_url or 'in-process',
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'routes': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--users', type=int, default=1000, help='dataset size')
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per route')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,78 @@
+import asyncio
+import logging
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from apps.rabbit import Rabbit
-from apps.database import create_tables
-from apps.routes import user_router, user_forgot_pw_router
+from apps.database import create_tables, dispose_engines, warm_up_engines
+from apps.cache import user_cache
+from apps.config import REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS, FORGOT_PASSWORD_PRUNE_INTERVAL_SECONDS, \
+    SLOW_REQUEST_SECONDS, WARMUP_ENABLED
+from apps.hashing import password_hasher
+from apps.metrics import MetricsMiddleware, registry, slow_request_profiler
+from apps.outbox import outbox_relay
+from apps.routes import user_router, user_forgot_pw_router, token_router, metrics_router
+from apps.services import RefreshTokenService, UserForgotPWService
+from apps.tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+refresh_token_pruner = PeriodicTask('refresh-token-pruner', RefreshTokenService.prune_expired,
+                                    REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS)
+forgot_password_pruner = PeriodicTask('forgot-password-pruner', UserForgotPWService.prune_expired,
+                                      FORGOT_PASSWORD_PRUNE_INTERVAL_SECONDS)
+
+registry.callback('user_cache_hits_total', 'User cache hits', 'counter', lambda: user_cache.backend.hits)
+registry.callback('user_cache_misses_total', 'User cache misses', 'counter', lambda: user_cache.backend.misses)
+registry.callback('user_cache_evictions_total', 'User cache evictions', 'counter',
+                  lambda: user_cache.backend.evictions)
+registry.callback('password_hasher_pending', 'Password hash jobs queued or running', 'gauge',
+                  lambda: password_hasher.pending)
+
+
+async def warm_up() -> None:
+    started = time.perf_counter()
+    results = await asyncio.gather(warm_up_engines(), password_hasher.warm_up(), Rabbit.warm_up(),
+                                   return_exceptions=True)
+    for name, result in zip(('database pool', 'password hasher', 'rabbitmq'), results):
+        if isinstance(result, BaseException):
+            logger.warning('Warm-up of %s failed: %r', name, result)
+    logger.info('Warm-up finished in %.1f ms', (time.perf_counter() - started) * 1000)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # await create_tables()
     # await Rabbit.setup_rabbitmq()
+    await Rabbit.connect()
+    if WARMUP_ENABLED:
+        await warm_up()
+    refresh_token_pruner.start()
+    forgot_password_pruner.start()
+    outbox_relay.start()
+    if SLOW_REQUEST_SECONDS:
+        slow_request_profiler.start()
     yield
+    slow_request_profiler.stop()
+    await outbox_relay.stop()
+    await forgot_password_pruner.stop()
+    await refresh_token_pruner.stop()
+    await Rabbit.close()
+    password_hasher.shutdown()
+    await dispose_engines()
 
 app = FastAPI(
     lifespan=lifespan,
-    title='auth service'
+    title='auth service',
+    default_response_class=ORJSONResponse
 )
 
 app.include_router(router=user_router)
 app.include_router(router=user_forgot_pw_router)
+app.include_router(router=token_router)
+app.include_router(router=metrics_router)
+
+app.add_middleware(MetricsMiddleware)
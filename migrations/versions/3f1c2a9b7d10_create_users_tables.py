@@ -0,0 +1,46 @@
+"""create users tables
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('username', sa.String(length=100), nullable=False),
+        sa.Column('fullname', sa.String(length=100), nullable=False),
+        sa.Column('email', sa.String(length=100), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_table(
+        'users_forgot_password',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('username', sa.String(length=100), nullable=False),
+        sa.Column('code', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='users_forgot_password_user_id_fkey'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('users_forgot_password')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,39 @@
+"""add unique and lookup indexes
+
+Revision ID: 8a4d6e2f1b35
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d6e2f1b35'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+    op.create_index(op.f('ix_users_forgot_password_user_id'), 'users_forgot_password', ['user_id'], unique=True)
+    op.create_index('ix_users_forgot_password_username_code', 'users_forgot_password', ['username', 'code'])
+    op.drop_constraint('users_forgot_password_user_id_fkey', 'users_forgot_password', type_='foreignkey')
+    op.create_foreign_key(
+        'users_forgot_password_user_id_fkey', 'users_forgot_password', 'users', ['user_id'], ['id'],
+        ondelete='CASCADE'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('users_forgot_password_user_id_fkey', 'users_forgot_password', type_='foreignkey')
+    op.create_foreign_key(
+        'users_forgot_password_user_id_fkey', 'users_forgot_password', 'users', ['user_id'], ['id']
+    )
+    op.drop_index('ix_users_forgot_password_username_code', table_name='users_forgot_password')
+    op.drop_index(op.f('ix_users_forgot_password_user_id'), table_name='users_forgot_password')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
@@ -0,0 +1,29 @@
+"""add user version
+
+Revision ID: a7d3e5f19c42
+Revises: f4c1d8e2a657
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e5f19c42'
+down_revision: Union[str, None] = 'f4c1d8e2a657'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                                     nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'updated_at')
+    op.drop_column('users', 'version')
@@ -0,0 +1,40 @@
+"""expire forgot password codes
+
+Revision ID: d2b8f4c6a913
+Revises: c5e7a1d92f40
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8f4c6a913'
+down_revision: Union[str, None] = 'c5e7a1d92f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Codes issued before this migration have no lifetime; expire them immediately.
+    op.add_column('users_forgot_password',
+                  sa.Column('expires_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                            nullable=False))
+    op.alter_column('users_forgot_password', 'expires_at', server_default=None)
+    op.add_column('users_forgot_password',
+                  sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.drop_index('ix_users_forgot_password_username_code', table_name='users_forgot_password')
+    op.create_index('ix_users_forgot_password_username_code_expires_at', 'users_forgot_password',
+                    ['username', 'code', 'expires_at'])
+    op.create_index(op.f('ix_users_forgot_password_expires_at'), 'users_forgot_password', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_forgot_password_expires_at'), table_name='users_forgot_password')
+    op.drop_index('ix_users_forgot_password_username_code_expires_at', table_name='users_forgot_password')
+    op.create_index('ix_users_forgot_password_username_code', 'users_forgot_password', ['username', 'code'])
+    op.drop_column('users_forgot_password', 'attempts')
+    op.drop_column('users_forgot_password', 'expires_at')
@@ -0,0 +1,38 @@
+"""add user search indexes
+
+Revision ID: f4c1d8e2a657
+Revises: e9a3c7b15d28
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1d8e2a657'
+down_revision: Union[str, None] = 'e9a3c7b15d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_COLUMNS = ('username', 'email', 'fullname')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Built concurrently so a large users table stays writable during the migration.
+    with op.get_context().autocommit_block():
+        for column in TRIGRAM_COLUMNS:
+            op.create_index(f'ix_users_{column}_trgm', 'users', [column], postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_users_username_lower_pattern', 'users', [sa.text('lower(username) text_pattern_ops')],
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_username_lower_pattern', table_name='users', postgresql_concurrently=True)
+        for column in reversed(TRIGRAM_COLUMNS):
+            op.drop_index(f'ix_users_{column}_trgm', table_name='users', postgresql_concurrently=True)
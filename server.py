@@ -0,0 +1,28 @@
+"""Production entry point: ``python -m server``.
+
+Runs SERVER_WORKERS uvicorn worker processes on uvloop and httptools. On
+SIGTERM each worker stops accepting connections, lets in-flight requests
+finish for up to SERVER_GRACEFUL_SHUTDOWN_SECONDS, then runs the lifespan
+shutdown, which closes the database and RabbitMQ pools.
+"""
+import uvicorn
+
+from apps.config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_KEEPALIVE_SECONDS, \
+    SERVER_GRACEFUL_SHUTDOWN_SECONDS
+
+
+def main():
+    uvicorn.run(
+        'main:app',
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        loop='uvloop',
+        http='httptools',
+        timeout_keep_alive=SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+    )
+
+
+if __name__ == '__main__':
+    main()
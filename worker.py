@@ -0,0 +1,56 @@
+"""Queue consumer entry point: ``python -m worker``.
+
+Consumes RESET_CODE_QUEUE_NAME with apps.consumer.RabbitConsumer until
+SIGTERM or SIGINT, then stops taking deliveries, finishes in-flight handlers
+and flushes pending acks. A lost broker connection is retried every
+CONSUMER_RECONNECT_SECONDS; unacked deliveries are redelivered by RabbitMQ.
+"""
+import asyncio
+import logging
+import signal
+
+import uvloop
+
+from apps import consumer
+from apps.config import CONSUMER_RECONNECT_SECONDS, RESET_CODE_EMAIL_ENABLED
+from apps.consumer import RabbitConsumer
+from apps.mail import send_reset_code_email
+from apps.rabbit import Rabbit
+
+logger = logging.getLogger('worker')
+
+
+async def run() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    if RESET_CODE_EMAIL_ENABLED:
+        consumer.reset_code_sender = send_reset_code_email
+    else:
+        logger.warning('SMTP_HOST is not set: reset codes are returned by the API and not queued for the worker')
+
+    await Rabbit.connect()
+    try:
+        while not stop.is_set():
+            try:
+                await RabbitConsumer().run(stop)
+            except Exception:
+                logger.exception('Consumer failed, reconnecting in %s s', CONSUMER_RECONNECT_SECONDS)
+                try:
+                    await asyncio.wait_for(stop.wait(), CONSUMER_RECONNECT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        await Rabbit.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    uvloop.install()
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()